@@ -0,0 +1,426 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import localdb
+import migrate
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_WORKDIR = os.path.join(APP_DIR, '.bench')
+DEFAULT_OUTPUT = os.path.join(APP_DIR, 'bench_results.json')
+
+IMAGE_COUNT = 50
+STARTUP_RUNS = 10
+STARTUP_BUDGET_MS = 800
+PERCENTILES = (50, 90, 95, 99)
+
+CATEGORIES = ('Кеды', 'Кроссовки', 'Ботинки', 'Туфли', 'Сандалии', 'Сапоги', 'Мокасины', 'Слипоны')
+MANUFACTURER_WORDS = ('Nord', 'Step', 'Urban', 'Trail', 'Classic', 'Runner', 'Alpine', 'Komfort')
+VENDOR_WORDS = ('Обувь', 'Shoes', 'Стиль', 'Маркет', 'Торг', 'Опт')
+ADJECTIVES = ('мужские', 'женские', 'детские', 'кожаные', 'замшевые', 'текстильные',
+              'зимние', 'летние', 'спортивные', 'повседневные', 'утепленные', 'легкие')
+MODELS = ('Air', 'Classic', 'Winter', 'Sport', 'Elegant', 'Street', 'Comfort', 'Trek',
+          'City', 'Light', 'Pro', 'Max')
+DESCRIPTION_WORDS = ('подошва', 'натуральная', 'кожа', 'стелька', 'амортизация', 'шнуровка',
+                     'молния', 'липучка', 'водоотталкивающий', 'материал', 'мех', 'сетка',
+                     'дышащий', 'верх', 'каблук', 'устойчивый', 'износостойкий', 'носок')
+CITIES = ('Москва', 'Казань', 'Пермь', 'Омск', 'Томск', 'Самара', 'Тверь', 'Уфа')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Олег', 'Ольга', 'Петр', 'Елена', 'Сергей')
+LAST_NAMES = ('Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Орлов')
+MIDDLE_NAMES = ('Иванович', 'Петрович', 'Сергеевич', 'Олегович', 'Андреевич')
+
+SEARCH_QUERIES = ('кроссовки', 'кожаные', 'Sport', 'SN00', 'Nord', 'водоотталкивающий')
+BENCH_USER = ('admin', '1234')
+
+
+def generate_images(image_dir, count=IMAGE_COUNT, seed=0):
+    from PyQt6.QtGui import QColor, QImage
+
+    rng = random.Random(seed)
+    os.makedirs(image_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(image_dir, f'product_{i + 1}.jpg')
+        if not os.path.exists(path):
+            image = QImage(300, 200, QImage.Format.Format_RGB32)
+            image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            image.save(path, 'JPG')
+        paths.append(path)
+    return paths
+
+
+def generate_catalog(path, size, seed=0, image_dir=None):
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    localdb.create_schema(path)
+    conn = localdb.connect(path)
+    try:
+        migrate.upgrade(conn, dialect=migrate.SQLITE)
+    finally:
+        conn.close()
+    images = generate_images(image_dir or os.path.join(os.path.dirname(path), 'images'), seed=seed)
+
+    vendor_count = max(5, min(40, size // 500))
+    manufacturer_count = max(5, min(60, size // 300))
+    vendors = [(f'{rng.choice(VENDOR_WORDS)}{i + 1}',) for i in range(vendor_count)]
+    manufacturers = [(f'{rng.choice(MANUFACTURER_WORDS)} {i + 1}',) for i in range(manufacturer_count)]
+
+    users = [('Ирина', 'Сергеевна', 'Кузнецова', 'admin', '1234', 'Администратор'),
+             ('Андрей', 'Игоревич', 'Мельников', 'manager', '1234', 'Менеджер')]
+    for i in range(max(10, size // 50)):
+        users.append((rng.choice(FIRST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(LAST_NAMES),
+                      f'client{i + 1}@mail.com', f'pass{i + 1}', 'Клиент'))
+
+    products = []
+    for i in range(size):
+        category = rng.randrange(len(CATEGORIES))
+        price = rng.randrange(10, 200) * 100
+        discount = rng.choice((0, 0, 0, 5, 10, 15, 20, 25, 30))
+        quantity = 0 if rng.random() < 0.08 else rng.randrange(1, 60)
+        description = ' '.join([rng.choice(ADJECTIVES)] + rng.sample(DESCRIPTION_WORDS, 6)).capitalize()
+        products.append((
+            f'SN{i + 1:06d}',
+            f'{CATEGORIES[category]} {rng.choice(MODELS)} {rng.randrange(100, 1000)}',
+            str(rng.randrange(35, 47)),
+            price, discount, quantity, description,
+            rng.choice(images),
+            rng.randrange(vendor_count) + 1,
+            rng.randrange(manufacturer_count) + 1,
+            category + 1,
+        ))
+
+    orders = []
+    order_items = []
+    start = date(2025, 1, 1)
+    for i in range(max(10, size // 5)):
+        order_date = start + timedelta(days=rng.randrange(365))
+        orders.append((rng.randrange(3, len(users) + 1), rng.randrange(len(CITIES)) + 1,
+                       rng.randrange(2) + 1, rng.randrange(100, 1000), order_date.isoformat(),
+                       (order_date + timedelta(days=rng.randrange(2, 14))).isoformat()))
+        for product_id in rng.sample(range(1, size + 1), min(size, rng.randrange(1, 4))):
+            order_items.append((i + 1, product_id, rng.randrange(1, 4)))
+
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.executemany('INSERT INTO categories (category_name) VALUES (?)',
+                             [(c,) for c in CATEGORIES])
+            conn.executemany('INSERT INTO manufacturers (manufacturer_name) VALUES (?)', manufacturers)
+            conn.executemany('INSERT INTO vendors (vendor_name) VALUES (?)', vendors)
+            conn.executemany('INSERT INTO order_statuses (status_name, is_closed) VALUES (?, ?)',
+                             [('Новый', 0), ('Завершен', 1)])
+            conn.executemany('INSERT INTO pickup_points (city, address) VALUES (?, ?)',
+                             [(city, f'ул. Ленина, {i + 1}') for i, city in enumerate(CITIES)])
+            conn.executemany('''
+                INSERT INTO users (first_name, middle_name, last_name, login, password, role)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', users)
+            conn.executemany('''
+                INSERT INTO products (article, product_name, size, price, discount, quantity,
+                                      description, image, vendor_id, manufacturer_id, category_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', products)
+            conn.executemany('''
+                INSERT INTO orders (user_id, pickup_point_id, status_id, code, order_date, delivery_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', orders)
+            conn.executemany('INSERT INTO order_items (order_id, product_id, amount) VALUES (?, ?, ?)',
+                             order_items)
+    finally:
+        conn.close()
+    return path
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    result = {'count': len(ordered)}
+    if not ordered:
+        return result
+    result['min_ms'] = round(ordered[0] * 1000, 3)
+    result['mean_ms'] = round(sum(ordered) / len(ordered) * 1000, 3)
+    for p in PERCENTILES:
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        result[f'p{p}_ms'] = round(ordered[rank - 1] * 1000, 3)
+    result['max_ms'] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.memory = {}
+
+    def time(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def mark(self, name):
+        self.memory[name] = peak_rss_kb()
+
+    def report(self):
+        return {name: dict(summarize(samples), peak_rss_kb=self.memory.get(name))
+                for name, samples in self.samples.items()}
+
+
+def run_scenarios(db_path, rounds, seed):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('LEVELUP_REPLICA', '')
+    os.chdir(APP_DIR)
+
+    import db
+    import migrate
+    db.configure_pool(connect=lambda: localdb.connect(db_path))
+    migrate.migrate(dialect=migrate.SQLITE)
+
+    import main
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication, QListView, QMessageBox
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    for name in ('critical', 'warning', 'information'):
+        setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: print(*args[1:3], file=sys.stderr)))
+
+    def pump(ms=0):
+        loop = QEventLoop()
+        QTimer.singleShot(ms, loop.quit)
+        loop.exec()
+
+    def wait(condition, timeout=600):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError('Каталог не загрузился')
+            pump(5)
+
+    rng = random.Random(seed)
+    recorder = Recorder()
+
+    for _ in range(rounds):
+        rows = recorder.time('fetch_products', db.fetch_products)
+    recorder.mark('fetch_products')
+
+    view = QListView()
+    view.resize(900, 700)
+    view.show()
+    for _ in range(rounds):
+        def fill():
+            store = main.CatalogStore()
+            model = main.product_model(view, main.CatalogListModel)
+            model.set_store(store)
+            model.set_products(store.extend(rows))
+            view.viewport().repaint()
+        recorder.time('fill_list', fill)
+    recorder.mark('fill_list')
+    product_ids = [row['id'] for row in rows]
+    del rows
+    view.close()
+    view.deleteLater()
+
+    login = main.Login()
+    snapshot = main.catalog_snapshot()
+    admin = None
+
+    def relogin(name):
+        nonlocal admin
+        if admin is not None:
+            admin.exit()
+            pump()
+        login.le_login.setText(BENCH_USER[0])
+        login.le_password.setText(BENCH_USER[1])
+        start = time.perf_counter()
+        recorder.time(name, login.login)
+        admin = login.window
+        wait(lambda: not snapshot.is_loading())
+        return time.perf_counter() - start
+
+    for _ in range(rounds):
+        snapshot.clear()
+        recorder.samples.setdefault('catalog_load', []).append(relogin('login'))
+    recorder.mark('login')
+    recorder.mark('catalog_load')
+
+    for _ in range(rounds):
+        relogin('switch_user')
+    recorder.mark('switch_user')
+
+    for query in SEARCH_QUERIES:
+        admin.show_all()
+        for i in range(1, len(query) + 1):
+            admin.le_search.setText(query[:i])
+            recorder.time('apply_filters', admin.apply_filters)
+    admin.show_all()
+    recorder.mark('apply_filters')
+
+    for _ in range(rounds):
+        product_id = rng.choice(product_ids)
+        with db.get_connection() as conn:
+            conn.cursor().execute('UPDATE products SET quantity = %s WHERE id = %s',
+                                  (rng.randrange(60), product_id))
+        recorder.time('refresh_products', admin.refresh_products, product_id)
+        wait(lambda: not snapshot.is_syncing())
+    recorder.mark('refresh_products')
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT product_id FROM product_order_stats WHERE order_lines > 0')
+        ordered_ids = [row['product_id'] for row in cursor.fetchall()]
+    for _ in range(rounds):
+        recorder.time('delete_check', main.Admin._remove_products,
+                      rng.sample(ordered_ids, min(len(ordered_ids), 50)))
+    recorder.mark('delete_check')
+
+    from replica import Replica
+    replica_path = db_path + '.replica'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(replica_path + suffix):
+            os.remove(replica_path + suffix)
+    replica = Replica(replica_path)
+    drain = lambda: sum(len(rows) for rows, *_ in replica.stream_products())
+    recorder.time('replica_copy', drain)
+    recorder.mark('replica_copy')
+    for _ in range(rounds):
+        recorder.time('replica_load', drain)
+    recorder.mark('replica_load')
+    replica.close()
+
+    for _ in range(rounds):
+        def open_form():
+            form = admin.product_form()
+            form.edit(rng.choice(product_ids))
+            app.processEvents()
+            return form
+        form = recorder.time('open_product_form', open_form)
+        form.close()
+    recorder.mark('open_product_form')
+
+    admin.exit()
+    return {
+        'products': len(product_ids),
+        'peak_rss_kb': peak_rss_kb(),
+        'operations': recorder.report(),
+    }
+
+
+def run_size(size, args):
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f'catalog_{size}_{args.seed}.db')
+    if args.regenerate or not os.path.exists(db_path):
+        start = time.perf_counter()
+        generate_catalog(db_path, size, args.seed, os.path.join(args.workdir, 'images'))
+        print(f'{size}: каталог создан за {time.perf_counter() - start:.1f} с', file=sys.stderr)
+
+    command = [sys.executable, os.path.abspath(__file__), '--worker', db_path,
+               '--rounds', str(args.rounds), '--seed', str(args.seed)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout)
+
+
+def run_startup(runs):
+    env = dict(os.environ, LEVELUP_STARTUP_PROBE='1')
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    command = [sys.executable, os.path.join(APP_DIR, 'main.py')]
+    samples = []
+    for i in range(runs + 1):
+        start = time.time()
+        result = subprocess.run(command, cwd=APP_DIR, env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, check=True)
+        ready = next(float(line.split()[1]) for line in result.stdout.splitlines()
+                     if line.startswith('startup_ready'))
+        if i:
+            samples.append(ready - start)
+    return summarize(samples)
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    sections = [('startup', {'startup': current['startup']}, {'startup': baseline.get('startup')})]
+    for size, result in current['results'].items():
+        base = baseline['results'].get(size)
+        if base is not None:
+            sections.append((size, result['operations'], base['operations']))
+    for size, operations, base_operations in sections:
+        for name, stats in operations.items():
+            old = base_operations.get(name)
+            if not old or not old.get('p50_ms'):
+                continue
+            for key in ('p50_ms', 'p95_ms'):
+                ratio = stats[key] / old[key] if old[key] else 1
+                flag = ' !' if ratio > threshold else ''
+                print(f'{size:>7} {name:<18} {key:<7} {old[key]:>10.3f} -> {stats[key]:>10.3f}'
+                      f'  x{ratio:.2f}{flag}')
+                if flag:
+                    regressions.append((size, name, key))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер производительности каталога')
+    parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--regenerate', action='store_true')
+    parser.add_argument('--compare', metavar='BASELINE')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--startup-runs', type=int, default=STARTUP_RUNS)
+    parser.add_argument('--startup-budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--worker', metavar='DB', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_scenarios(args.worker, args.rounds, args.seed), sys.stdout)
+        return 0
+
+    from PyQt6.QtCore import QT_VERSION_STR
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'rounds': args.rounds,
+        'startup': dict(run_startup(args.startup_runs), budget_ms=args.startup_budget_ms),
+        'results': {str(size): run_size(size, args) for size in args.sizes},
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'Результаты записаны в {args.output}', file=sys.stderr)
+
+    failed = False
+    startup = report['startup']
+    print(f"Запуск до окна входа: p50 {startup['p50_ms']:.0f} мс, p95 {startup['p95_ms']:.0f} мс "
+          f"(бюджет {args.startup_budget_ms:.0f} мс)", file=sys.stderr)
+    if startup['p50_ms'] > args.startup_budget_ms:
+        print('Время запуска превышает бюджет', file=sys.stderr)
+        failed = True
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
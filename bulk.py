@@ -0,0 +1,336 @@
+import csv
+import json
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+
+from db import (ARTICLE_PREFIX, ASSIGN_ARTICLE, GENERATED_ARTICLE, REFERENCE_TABLES,
+                existing_articles_query, get_connection, reference_cache, stream_products)
+
+IMPORT_CHUNK_SIZE = 500
+
+EXPORT_FIELDS = ('id', 'article', 'product_name', 'category_name', 'manufacturer_name',
+                 'vendor_name', 'size', 'price', 'discount', 'quantity', 'description', 'image')
+
+REFERENCE_FIELDS = {
+    'category_name': 'categories',
+    'manufacturer_name': 'manufacturers',
+    'vendor_name': 'vendors',
+}
+
+INSERT_PRODUCT = '''
+    INSERT INTO products
+        (article, product_name, category_id, manufacturer_id, vendor_id,
+         size, price, discount, quantity, description, image)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def summary(self) -> str:
+        text = f'Добавлено товаров: {self.inserted}'
+        if self.errors:
+            text += f', ошибок: {len(self.errors)}'
+        return text
+
+
+def file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.csv', '.json'):
+        raise ValueError('Поддерживаются только файлы CSV и JSON')
+    return ext[1:]
+
+
+def read_rows(path: str):
+    if file_format(path) == 'json':
+        with open(path, encoding='utf-8-sig') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError('JSON должен содержать список товаров')
+        yield from enumerate(data, start=1)
+        return
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(row, field, default, low=None, high=None, integer=True):
+    value = _text(row, field)
+    if value is None:
+        return default
+    try:
+        number = Decimal(value.replace(',', '.').replace(' ', ''))
+    except InvalidOperation:
+        raise ValueError(f'{field}: не число')
+    if integer and number != number.to_integral_value():
+        raise ValueError(f'{field}: должно быть целым')
+    if low is not None and number < low or high is not None and number > high:
+        raise ValueError(f'{field}: вне диапазона')
+    if integer:
+        return int(number)
+    return int(number) if number == number.to_integral_value() else float(number)
+
+
+def _article(row):
+    value = _text(row, 'article')
+    if value is not None and GENERATED_ARTICLE.fullmatch(value):
+        raise ValueError(f'article: артикулы вида {ARTICLE_PREFIX}0001 назначаются автоматически')
+    return value
+
+
+def _image(row):
+    import images
+
+    value = _text(row, 'image')
+    if value is None:
+        return None
+    if images.is_image_key(value) and os.path.exists(images.rendition_path(value, images.THUMBNAIL_SIZE)):
+        return value
+    path = os.path.join(images.APP_DIR, value)
+    if value in ('.', '..') or os.path.basename(value) != value or not os.path.isfile(path):
+        raise ValueError('image: нет такого файла в папке приложения')
+    try:
+        return images.ingest(path)
+    except (OSError, images.ImageError) as e:
+        raise ValueError(f'image: {e}')
+
+
+def parse_row(row):
+    if not isinstance(row, dict):
+        raise ValueError('строка должна быть объектом')
+    name = _text(row, 'product_name')
+    if name is None:
+        raise ValueError('product_name: не заполнено')
+    product = {
+        'article': _article(row),
+        'product_name': name,
+        'size': _text(row, 'size'),
+        'price': _number(row, 'price', None, low=0, integer=False),
+        'discount': _number(row, 'discount', 0, low=0, high=100),
+        'quantity': _number(row, 'quantity', 0, low=0),
+        'description': _text(row, 'description') or '',
+        'image': _image(row),
+    }
+    if product['price'] is None:
+        raise ValueError('price: не заполнено')
+    for field in REFERENCE_FIELDS:
+        product[field] = _text(row, field)
+        if product[field] is None:
+            raise ValueError(f'{field}: не заполнено')
+    return product
+
+
+class ReferenceResolver:
+    def __init__(self, create_missing=True):
+        self.create_missing = create_missing
+        self.created = False
+        self._pending = []
+        self._ids = {}
+        for table, column in REFERENCE_TABLES.items():
+            self._ids[table] = {row[column].casefold(): row['id']
+                                for row in reference_cache().get(table)}
+
+    def missing(self, product):
+        return [(table, product[field]) for field, table in REFERENCE_FIELDS.items()
+                if product[field].casefold() not in self._ids[table]]
+
+    def create_missing_for(self, cursor, product):
+        for table, name in self.missing(product):
+            cursor.execute(f'INSERT INTO {table} ({REFERENCE_TABLES[table]}) VALUES (%s)', (name,))
+            self._ids[table][name.casefold()] = cursor.lastrowid
+            self._pending.append((table, name.casefold()))
+
+    def commit(self):
+        self.created = self.created or bool(self._pending)
+        self._pending.clear()
+
+    def rollback(self):
+        for table, key in self._pending:
+            self._ids[table].pop(key, None)
+        self._pending.clear()
+
+    def ids(self, product):
+        return tuple(self._ids[table][product[field].casefold()]
+                     for field, table in REFERENCE_FIELDS.items())
+
+
+def _existing_articles(cursor, articles):
+    if not articles:
+        return set()
+    cursor.execute(*existing_articles_query(articles))
+    return {row['article'] for row in cursor.fetchall()}
+
+
+def _values(product, resolver):
+    category_id, manufacturer_id, vendor_id = resolver.ids(product)
+    return (product['article'], product['product_name'], category_id, manufacturer_id, vendor_id,
+            product['size'], product['price'], product['discount'], product['quantity'],
+            product['description'], product['image'])
+
+
+def _insert(conn, cursor, resolver, products):
+    conn.begin()
+    try:
+        for product in products:
+            resolver.create_missing_for(cursor, product)
+        numbered = [product for product in products if product['article']]
+        if numbered:
+            cursor.executemany(INSERT_PRODUCT, [_values(product, resolver) for product in numbered])
+        for product in products:
+            if not product['article']:
+                cursor.execute(INSERT_PRODUCT, _values(product, resolver))
+                cursor.execute(ASSIGN_ARTICLE, (cursor.lastrowid,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        resolver.rollback()
+        raise
+    resolver.commit()
+
+
+def _write_chunk(chunk, resolver, result):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        existing = _existing_articles(cursor, {p['article'] for _, p in chunk if p['article']})
+        rows = []
+        for line, product in chunk:
+            if product['article'] in existing:
+                result.error(line, f"артикул {product['article']} уже существует")
+                continue
+            missing = resolver.missing(product)
+            if missing and not resolver.create_missing:
+                result.error(line, ', '.join(f'{table}: нет «{name}»' for table, name in missing))
+                continue
+            if product['article']:
+                existing.add(product['article'])
+            rows.append((line, product))
+        if not rows:
+            return
+
+        try:
+            _insert(conn, cursor, resolver, [product for _, product in rows])
+            result.inserted += len(rows)
+            return
+        except Exception:
+            pass
+
+        for line, product in rows:
+            try:
+                _insert(conn, cursor, resolver, [product])
+                result.inserted += 1
+            except Exception as e:
+                result.error(line, str(e))
+
+
+def import_products(path, create_references=True, chunk_size=IMPORT_CHUNK_SIZE,
+                    progress=None) -> ImportResult:
+    result = ImportResult()
+    resolver = ReferenceResolver(create_references)
+    chunk = []
+    try:
+        for line, row in read_rows(path):
+            try:
+                chunk.append((line, parse_row(row)))
+            except ValueError as e:
+                result.error(line, str(e))
+            if len(chunk) >= chunk_size:
+                _write_chunk(chunk, resolver, result)
+                chunk = []
+                if progress is not None:
+                    progress(result)
+        if chunk:
+            _write_chunk(chunk, resolver, result)
+    finally:
+        if resolver.created:
+            reference_cache().invalidate()
+    result.errors.sort()
+    if progress is not None:
+        progress(result)
+    return result
+
+
+def _export_value(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def export_products(path, progress=None) -> int:
+    fmt = file_format(path)
+    tmp_path = path + '.tmp'
+    exported = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, EXPORT_FIELDS, extrasaction='ignore', delimiter=';')
+            writer.writeheader()
+        else:
+            f.write('[')
+        for rows, loaded, total, _ in stream_products():
+            for row in rows:
+                if fmt == 'csv':
+                    writer.writerow(row)
+                else:
+                    f.write(',\n' if exported else '\n')
+                    json.dump({field: _export_value(row.get(field)) for field in EXPORT_FIELDS},
+                              f, ensure_ascii=False)
+                exported += 1
+            if progress is not None:
+                progress(loaded, total)
+        if fmt == 'json':
+            f.write('\n]\n')
+    os.replace(tmp_path, path)
+    return exported
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Импорт и экспорт товаров')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='загрузить товары из CSV или JSON')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--no-create-references', action='store_true',
+                               help='не создавать отсутствующих поставщиков, производителей и категории')
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    export_parser = commands.add_parser('export', help='выгрузить каталог в CSV или JSON')
+    export_parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        count = export_products(args.path)
+        print(f'Выгружено товаров: {count}')
+        return 0
+
+    result = import_products(args.path, create_references=not args.no_create_references,
+                             chunk_size=args.chunk_size)
+    for line, message in result.errors:
+        print(f'{args.path}:{line}: {message}', file=sys.stderr)
+    print(result.summary())
+    return 1 if result.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import compress, count
+
+
+def normalize(text) -> str:
+    return str(text or '').casefold().replace('ё', 'е')
+
+
+SEARCH_FIELDS = ('product_name', 'description', 'manufacturer_name',
+                 'vendor_name', 'category_name', 'article', 'size')
+
+
+def facet_label_key(label):
+    try:
+        return 0, float(label.replace(',', '.')), ''
+    except ValueError:
+        return 1, 0.0, normalize(label)
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def search_text(product) -> str:
+    return '\n'.join(normalize(product.get(field)) for field in SEARCH_FIELDS)
+
+
+class SearchIndex:
+    def __init__(self, store):
+        self.texts = store.search_texts
+        self.alive = store.alive
+        self._postings = {}
+        self._last_query = None
+        self._last_result = None
+
+    def add(self, pos):
+        for trigram in trigrams(self.texts[pos]):
+            posting = self._postings.get(trigram)
+            if posting is None:
+                self._postings[trigram] = array('i', (pos,))
+            elif posting[-1] < pos:
+                posting.append(pos)
+            elif not _has_position(posting, pos):
+                posting.insert(bisect_left(posting, pos), pos)
+        self._last_query = None
+
+    def remove(self, pos):
+        for trigram in trigrams(self.texts[pos]):
+            posting = self._postings.get(trigram)
+            if posting is not None and _has_position(posting, pos):
+                del posting[bisect_left(posting, pos)]
+                if not posting:
+                    del self._postings[trigram]
+        self._last_query = None
+
+    def matches(self, pos, query: str) -> bool:
+        return query in self.texts[pos]
+
+    def search(self, query):
+        query = normalize(query.strip())
+        if not query:
+            return None
+
+        if self._last_query is not None and self._last_query in query:
+            candidates = self._last_result
+        elif len(query) >= 3:
+            postings = sorted((self._postings.get(t, ()) for t in trigrams(query)), key=len)
+            candidates = sorted(set(postings[0]).intersection(*postings[1:]))
+        else:
+            candidates = mask_positions(self.alive)
+
+        texts = self.texts
+        result = [pos for pos in candidates if query in texts[pos]]
+        self._last_query = query
+        self._last_result = result
+        return result
+
+
+def _has_position(posting, pos) -> bool:
+    i = bisect_left(posting, pos)
+    return i < len(posting) and posting[i] == pos
+
+
+HIGHLIGHT_NONE, HIGHLIGHT_OUT_OF_STOCK, HIGHLIGHT_BIG_DISCOUNT = 0, 1, 2
+BIG_DISCOUNT = 15
+
+
+def mask_positions(mask):
+    return list(compress(range(len(mask)), mask))
+
+
+def positions_mask(positions) -> int:
+    if not positions:
+        return 0
+    low = min(positions) >> 3
+    mask = bytearray((max(positions) >> 3) - low + 1)
+    for pos in positions:
+        mask[(pos >> 3) - low] |= 1 << (pos & 7)
+    return int.from_bytes(mask, 'little') << (low << 3)
+
+
+_BYTE_POSITIONS = tuple(tuple(i for i in range(8) if byte >> i & 1) for byte in range(256))
+
+
+def bit_positions(bits) -> list:
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    return [base + i for base, byte in zip(count(0, 8), data) if byte for i in _BYTE_POSITIONS[byte]]
+
+
+PRICE_BANDS = (3000, 5000, 8000, 12000)
+DISCOUNT_BANDS = (1, 10, BIG_DISCOUNT + 1)
+FACETS = ('vendor', 'manufacturer', 'category', 'size', 'price_band', 'discount_band', 'in_stock')
+
+
+def band_labels(bounds, unit):
+    labels = [f'до {bounds[0]}{unit}']
+    labels += [f'{low}–{high - 1}{unit}' for low, high in zip(bounds, bounds[1:])]
+    labels.append(f'от {bounds[-1]}{unit}')
+    return labels
+
+
+class StringTable:
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+        return code
+
+    def find(self, value):
+        return self._codes.get(value)
+
+
+class Facet:
+    def __init__(self, labels=()):
+        self.labels = StringTable()
+        for label in labels:
+            self.labels.code(label)
+        self.column = array('i')
+        self.counts = defaultdict(int)
+        self._bits = defaultdict(int)
+        self._added = defaultdict(list)
+
+    def bits(self, code) -> int:
+        added = self._added.pop(code, None)
+        if added:
+            self._bits[code] |= positions_mask(added)
+        return self._bits.get(code, 0)
+
+    def flush(self):
+        for code in list(self._added):
+            self.bits(code)
+
+    def union(self, codes) -> int:
+        result = 0
+        for code in codes:
+            result |= self.bits(code)
+        return result
+
+    def assign(self, pos, code):
+        old = self.column[pos]
+        if old == code:
+            return
+        if old >= 0:
+            self.discard(pos)
+        self.column[pos] = code
+        self._added[code].append(pos)
+        self.counts[code] += 1
+
+    def discard(self, pos):
+        code = self.column[pos]
+        if code < 0:
+            return
+        bits = self.bits(code)
+        if bits >> pos & 1:
+            self._bits[code] = bits & ~(1 << pos)
+            self.counts[code] -= 1
+
+
+class ProductRow:
+    __slots__ = ('store', 'pos')
+
+    def __init__(self, store, pos):
+        self.store = store
+        self.pos = pos
+
+    def __getitem__(self, key):
+        return CatalogStore.GETTERS[key](self.store, self.pos)
+
+    def get(self, key, default=None):
+        getter = CatalogStore.GETTERS.get(key)
+        return default if getter is None else getter(self.store, self.pos)
+
+
+def _number(value):
+    return int(value) if value.is_integer() else value
+
+
+class CatalogStore:
+    TEXT_FIELDS = ('article', 'product_name', 'size', 'description', 'image', 'last_order_date')
+
+    GETTERS = {
+        'id': lambda s, p: s.ids[p],
+        'price': lambda s, p: _number(s.price[p]),
+        'final_price': lambda s, p: s.final_price[p],
+        'discount': lambda s, p: s.discount[p],
+        'quantity': lambda s, p: s.quantity[p],
+        'units_ordered': lambda s, p: s.units_ordered[p],
+        'open_orders': lambda s, p: s.open_orders[p],
+        'vendor_name': lambda s, p: s.vendors[s.vendor[p]],
+        'manufacturer_name': lambda s, p: s.manufacturers[s.manufacturer[p]],
+        'category_name': lambda s, p: s.categories[s.category[p]],
+        **{field: (lambda f: lambda s, p: s.texts[f][p])(field) for field in TEXT_FIELDS},
+    }
+
+    def __init__(self):
+        self.ids = array('q')
+        self.price = array('d')
+        self.final_price = array('d')
+        self.discount = array('i')
+        self.quantity = array('i')
+        self.units_ordered = array('i')
+        self.open_orders = array('i')
+        self.highlight = bytearray()
+        self.alive = bytearray()
+        self.texts = {field: [] for field in self.TEXT_FIELDS}
+        self.search_texts = []
+        self.facets = {name: Facet() for name in FACETS}
+        self.facets['price_band'] = Facet(band_labels(PRICE_BANDS, ' ₽'))
+        self.facets['discount_band'] = Facet(['Без скидки'] + band_labels(DISCOUNT_BANDS, '%')[1:])
+        self.facets['in_stock'] = Facet(['В наличии', 'Нет в наличии'])
+        self.vendor = self.facets['vendor'].column
+        self.manufacturer = self.facets['manufacturer'].column
+        self.category = self.facets['category'].column
+        self.vendors = self.facets['vendor'].labels
+        self.manufacturers = self.facets['manufacturer'].labels
+        self.categories = self.facets['category'].labels
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, product_id):
+        return product_id in self._positions
+
+    def position(self, product_id):
+        return self._positions.get(product_id)
+
+    def row(self, pos) -> ProductRow:
+        return ProductRow(self, pos)
+
+    def live_positions(self):
+        return mask_positions(self.alive)
+
+    def live_bits(self) -> int:
+        return self.facets['in_stock'].union(self.facets['in_stock'].counts)
+
+    def extend(self, products):
+        positions = [self.upsert(product) for product in products]
+        for facet in self.facets.values():
+            facet.flush()
+        return positions
+
+    def upsert(self, product) -> int:
+        pos = self._positions.get(product['id'])
+        if pos is None:
+            pos = len(self.ids)
+            self._positions[product['id']] = pos
+            self.ids.append(product['id'])
+            for column in (self.price, self.final_price):
+                column.append(0.0)
+            for column in (self.discount, self.quantity, self.units_ordered, self.open_orders):
+                column.append(0)
+            self.highlight.append(HIGHLIGHT_NONE)
+            self.alive.append(1)
+            for values in self.texts.values():
+                values.append('')
+            self.search_texts.append('')
+            for facet in self.facets.values():
+                facet.column.append(-1)
+
+        price = float(product['price'] or 0)
+        discount = int(product['discount'] or 0)
+        quantity = int(product['quantity'] or 0)
+        self.price[pos] = price
+        self.discount[pos] = discount
+        self.quantity[pos] = quantity
+        self.units_ordered[pos] = int(product.get('units_ordered') or 0)
+        self.open_orders[pos] = int(product.get('open_orders') or 0)
+        self.final_price[pos] = price - price * discount / 100
+        if quantity == 0:
+            self.highlight[pos] = HIGHLIGHT_OUT_OF_STOCK
+        elif discount > BIG_DISCOUNT:
+            self.highlight[pos] = HIGHLIGHT_BIG_DISCOUNT
+        else:
+            self.highlight[pos] = HIGHLIGHT_NONE
+
+        for field, values in self.texts.items():
+            value = product.get(field)
+            values[pos] = sys.intern(str(value)) if value is not None else ''
+        self.search_texts[pos] = search_text(product)
+
+        facets = self.facets
+        facets['vendor'].assign(pos, self.vendors.code(product['vendor_name']))
+        facets['manufacturer'].assign(pos, self.manufacturers.code(product['manufacturer_name']))
+        facets['category'].assign(pos, self.categories.code(product['category_name']))
+        facets['size'].assign(pos, facets['size'].labels.code(self.texts['size'][pos] or '—'))
+        facets['price_band'].assign(pos, bisect_right(PRICE_BANDS, self.final_price[pos]))
+        facets['discount_band'].assign(pos, bisect_right(DISCOUNT_BANDS, discount))
+        facets['in_stock'].assign(pos, 0 if quantity > 0 else 1)
+        return pos
+
+    def remove(self, product_id):
+        pos = self._positions.pop(product_id, None)
+        if pos is not None:
+            self.alive[pos] = 0
+            for facet in self.facets.values():
+                facet.discard(pos)
+        return pos
+
+    def filter(self, vendor=None, positions=None):
+        if vendor is not None:
+            code = self.vendors.find(vendor)
+            if code is None:
+                return []
+            bits = self.facets['vendor'].bits(code)
+            if positions is None:
+                return bit_positions(bits)
+            mask = bits.to_bytes((len(self.ids) + 7) // 8, 'little')
+            return [pos for pos in positions if mask[pos >> 3] >> (pos & 7) & 1]
+        mask = self.alive
+        if positions is None:
+            return mask_positions(mask)
+        return list(compress(positions, map(mask.__getitem__, positions)))
+
+    def facet_matches(self, pos, selection) -> bool:
+        return all(self.facets[name].column[pos] in codes for name, codes in selection.items() if codes)
+
+    def facet_search(self, selection, positions=None, counted=FACETS):
+        base = self.live_bits()
+        if positions is not None:
+            base &= positions_mask(positions)
+        chosen = {name: self.facets[name].union(codes) for name, codes in selection.items() if codes}
+        result = base
+        for bits in chosen.values():
+            result &= bits
+
+        counts = {}
+        for name in counted:
+            facet = self.facets[name]
+            others = [bits for other, bits in chosen.items() if other != name]
+            if positions is None and not others:
+                counts[name] = dict(facet.counts)
+                continue
+            mask = base
+            for bits in others:
+                mask &= bits
+            counts[name] = {code: (facet.bits(code) & mask).bit_count() for code in facet.counts}
+        return bit_positions(result), counts
+
+    def sort(self, positions, field='quantity', descending=False):
+        return sorted(positions, key=getattr(self, field).__getitem__, reverse=descending)
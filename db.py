@@ -0,0 +1,497 @@
+import atexit
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from metrics import instrument, timed
+
+DB_SETTINGS = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '',
+    'database': 'footwear_store',
+}
+
+POOL_SIZE = int(os.environ.get('LEVELUP_DB_POOL_SIZE', 4))
+POOL_IDLE_TIMEOUT = float(os.environ.get('LEVELUP_DB_IDLE_TIMEOUT', 300))
+POOL_PING_INTERVAL = float(os.environ.get('LEVELUP_DB_PING_INTERVAL', 30))
+POOL_ACQUIRE_TIMEOUT = 10
+
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def preload_driver():
+    import pymysql
+
+
+def is_broken_connection_error(exc) -> bool:
+    import pymysql
+
+    return isinstance(exc, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+
+
+def _returned_to_pool():
+    import pymysql
+
+    return pymysql.err.InterfaceError(0, 'Connection returned to pool')
+
+
+def connect():
+    import pymysql
+
+    return pymysql.connect(
+        **DB_SETTINGS,
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=True
+    )
+
+
+class PooledConnection:
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise _returned_to_pool()
+        return getattr(self._raw, name)
+
+    def cursor(self, *args):
+        if self._raw is None:
+            raise _returned_to_pool()
+        return instrument(self._raw.cursor(*args))
+
+    def close(self, broken=False):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, broken)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(broken=exc is not None and is_broken_connection_error(exc))
+
+
+class ConnectionPool:
+    def __init__(self, connect=connect, size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 ping_interval=POOL_PING_INTERVAL):
+        self._connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self._idle = deque()
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=POOL_ACQUIRE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._close_expired()
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.size:
+                    raw, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise PoolTimeout('Нет свободных подключений к базе данных')
+            self._in_use += 1
+
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif time.monotonic() - last_used > self.ping_interval:
+                try:
+                    raw.ping(reconnect=True)
+                except Exception:
+                    self._close_quietly(raw)
+                    raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw)
+
+    def release(self, raw, broken=False):
+        from pymysql.constants import SERVER_STATUS
+
+        if not broken:
+            try:
+                if raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    raw.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._close_quietly(raw)
+        with self._cond:
+            self._in_use -= 1
+            if not broken:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    def _close_expired(self):
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            raw, _ = self._idle.popleft()
+            self._close_quietly(raw)
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+
+
+def configure_pool(**settings):
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+    _pool = ConnectionPool(**settings)
+    return _pool
+
+
+def get_pool() -> ConnectionPool:
+    return _pool if _pool is not None else configure_pool()
+
+
+def get_connection() -> PooledConnection:
+    return get_pool().acquire()
+
+
+atexit.register(lambda: _pool is not None and _pool.close_all())
+
+
+REFERENCE_CHECK_INTERVAL = 30
+
+REFERENCE_TABLES = {
+    'categories': 'category_name',
+    'manufacturers': 'manufacturer_name',
+    'vendors': 'vendor_name',
+}
+
+
+def reference_version(cursor):
+    cursor.execute('SELECT ' + ', '.join(
+        f"(SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, {column}))), 0))"
+        f" FROM {table}) AS {table}"
+        for table, column in REFERENCE_TABLES.items()))
+    return tuple(cursor.fetchone().values())
+
+
+def fetch_reference_version():
+    with get_connection() as conn:
+        return reference_version(conn.cursor())
+
+
+def fetch_references():
+    query = ' UNION ALL '.join(
+        f"SELECT '{table}' AS kind, id, {column} AS name FROM {table}"
+        for table, column in REFERENCE_TABLES.items())
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query + ' ORDER BY kind, name')
+        rows = cursor.fetchall()
+        version = reference_version(cursor)
+
+    data = {table: [] for table in REFERENCE_TABLES}
+    for row in rows:
+        data[row['kind']].append({'id': row['id'], REFERENCE_TABLES[row['kind']]: row['name']})
+    return data, version
+
+
+class ReferenceCache:
+    def __init__(self, check_interval=REFERENCE_CHECK_INTERVAL, source=None):
+        self.check_interval = check_interval
+        self._fetch_references = source.fetch_references if source else fetch_references
+        self._fetch_version = source.fetch_reference_version if source else fetch_reference_version
+        self._data = None
+        self._version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, table):
+        with self._lock:
+            if self._data is None:
+                self._load()
+            return self._data[table]
+
+    def get_all(self):
+        with self._lock:
+            if self._data is None:
+                self._load()
+            return self._data
+
+    def get_versioned(self):
+        with self._lock:
+            if self._data is None:
+                self._load()
+            return self._data, self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._version = None
+
+    def check(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        version = self._fetch_version()
+        with self._lock:
+            self._checked_at = time.monotonic()
+            changed = self._version is not None and version != self._version
+            self._version = version
+            if changed:
+                self._data = None
+        return changed
+
+    @timed('load_references')
+    def _load(self):
+        self._data, version = self._fetch_references()
+        if self._version is None:
+            self._version = version
+            self._checked_at = time.monotonic()
+
+
+_reference_cache = ReferenceCache()
+
+
+def configure_references(source=None):
+    global _reference_cache
+    _reference_cache = ReferenceCache(source=source)
+    return _reference_cache
+
+
+def reference_cache() -> ReferenceCache:
+    return _reference_cache
+
+
+CATALOG_CHUNK_SIZE = 500
+CATALOG_PAGE_SIZE = 100
+SYNC_OVERLAP = timedelta(seconds=2)
+DELETION_RETENTION = timedelta(hours=float(os.environ.get('LEVELUP_DELETION_RETENTION_HOURS', 24)))
+
+ARTICLE_PREFIX = 'ART'
+GENERATED_ARTICLE = re.compile(rf'{ARTICLE_PREFIX}\d+', re.IGNORECASE)
+ASSIGN_ARTICLE = (f"UPDATE products SET article = CONCAT('{ARTICLE_PREFIX}', "
+                  "LPAD(id, GREATEST(CHAR_LENGTH(id), 4), '0')) WHERE id = %s AND article IS NULL")
+
+
+def existing_articles_query(articles):
+    articles = list(articles)
+    placeholders = ', '.join(['%s'] * len(articles))
+    return f'SELECT article FROM products WHERE article IN ({placeholders})', articles
+
+
+PRODUCTS_QUERY = '''
+    SELECT p.id, p.article, p.product_name, p.size, p.price,
+           p.discount, p.quantity, p.description, p.image,
+           v.vendor_name, m.manufacturer_name, c.category_name,
+           p.vendor_id, p.manufacturer_id, p.category_id,
+           COALESCE(s.units_ordered, 0) AS units_ordered,
+           COALESCE(s.open_orders, 0) AS open_orders, s.last_order_date
+    FROM products p
+    JOIN vendors v ON p.vendor_id = v.id
+    JOIN manufacturers m ON p.manufacturer_id = m.id
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN product_order_stats s ON s.product_id = p.id
+'''
+
+CHANGED_PRODUCTS_QUERY = PRODUCTS_QUERY + '''
+    JOIN (SELECT id FROM products WHERE updated_at >= %(since)s
+          UNION SELECT product_id FROM product_order_stats WHERE updated_at >= %(since)s) changed
+      ON changed.id = p.id
+'''
+
+DELETED_PRODUCTS_QUERY = 'SELECT product_id FROM product_deletions WHERE deleted_at >= %s'
+PRUNE_DELETIONS = 'DELETE FROM product_deletions WHERE deleted_at < %s'
+
+VENDOR_NAMES_QUERY = '''
+    SELECT DISTINCT v.vendor_name
+    FROM vendors v
+    JOIN products p ON p.vendor_id = v.id
+    ORDER BY v.vendor_name
+'''
+
+LOGIN_QUERY = 'SELECT * FROM users WHERE login = %s AND password = %s'
+
+
+@timed('fetch_products')
+def fetch_products():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(PRODUCTS_QUERY)
+        return cursor.fetchall()
+
+
+@timed('fetch_product')
+def fetch_product(product_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(PRODUCTS_QUERY + ' WHERE p.id = %s', (product_id,))
+        return cursor.fetchone()
+
+
+def fetch_image_names():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT image FROM products WHERE image IS NOT NULL')
+        return {row['image'] for row in cursor.fetchall()}
+
+
+@timed('fetch_product_changes')
+def fetch_product_changes(since):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT CURRENT_TIMESTAMP(6) AS now')
+        now = cursor.fetchone()['now']
+        if since - SYNC_OVERLAP < now - DELETION_RETENTION:
+            return None
+        cursor.execute(CHANGED_PRODUCTS_QUERY, {'since': since - SYNC_OVERLAP})
+        changed = cursor.fetchall()
+        cursor.execute(DELETED_PRODUCTS_QUERY, (since - SYNC_OVERLAP,))
+        deleted = [row['product_id'] for row in cursor.fetchall()]
+    return changed, deleted, now
+
+
+def prune_deletions(cursor):
+    cursor.execute('SELECT CURRENT_TIMESTAMP(6) AS now')
+    cursor.execute(PRUNE_DELETIONS, (cursor.fetchone()['now'] - DELETION_RETENTION,))
+
+
+def stream_products(chunk_size=CATALOG_CHUNK_SIZE, cancelled=lambda: False):
+    import pymysql
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) AS cnt, CURRENT_TIMESTAMP(6) AS now FROM products')
+        row = cursor.fetchone()
+        total, synced_at = row['cnt'], row['now']
+
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(PRODUCTS_QUERY)
+        loaded = 0
+        drained = False
+        try:
+            while not cancelled():
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    drained = True
+                    if not loaded:
+                        yield [], 0, 0, synced_at
+                    break
+                loaded += len(rows)
+                yield rows, loaded, max(total, loaded), synced_at
+        finally:
+            if not drained:
+                conn.close(broken=True)
+
+
+SORT_NONE, SORT_QUANTITY_ASC, SORT_QUANTITY_DESC, SORT_UNITS_DESC, SORT_OPEN_ORDERS_DESC = range(5)
+
+SORT_FIELDS = {
+    SORT_NONE: (None, 'p.id', False),
+    SORT_QUANTITY_ASC: ('quantity', 'p.quantity', False),
+    SORT_QUANTITY_DESC: ('quantity', 'p.quantity', True),
+    SORT_UNITS_DESC: ('units_ordered', 'COALESCE(s.units_ordered, 0)', True),
+    SORT_OPEN_ORDERS_DESC: ('open_orders', 'COALESCE(s.open_orders, 0)', True),
+}
+
+
+def page_order(field, column, descending):
+    if field is None:
+        return 'p.id', 'p.id > %(after_id)s'
+    if descending:
+        return (f'{column} DESC, p.id',
+                f'({column} < %(after_value)s OR '
+                f'({column} = %(after_value)s AND p.id > %(after_id)s))')
+    return f'{column}, p.id', f'({column}, p.id) > (%(after_value)s, %(after_id)s)'
+
+
+PAGE_ORDER = {sort: page_order(*spec) for sort, spec in SORT_FIELDS.items()}
+
+
+def fulltext_query(search: str) -> str:
+    return '"' + search.replace('"', ' ') + '"'
+
+
+def product_page_query(search='', vendor=None, sort=SORT_NONE, after=None,
+                       limit=CATALOG_PAGE_SIZE):
+    order_by, keyset = PAGE_ORDER[sort]
+    query = PRODUCTS_QUERY
+    where = []
+    params = {'limit': limit}
+
+    if vendor:
+        where.append('v.vendor_name = %(vendor)s')
+        params['vendor'] = vendor
+
+    search = search.strip()
+    if search:
+        params['like'] = '%' + search + '%'
+        if len(search) >= 2:
+            matches = ['''SELECT id FROM products
+                WHERE MATCH(product_name, description, article, size)
+                      AGAINST (%(fulltext)s IN BOOLEAN MODE)''']
+            params['fulltext'] = fulltext_query(search)
+        else:
+            matches = ['''SELECT id FROM products
+                WHERE product_name LIKE %(like)s OR description LIKE %(like)s
+                   OR article LIKE %(like)s OR size LIKE %(like)s''']
+        matches += [
+            'SELECT id FROM products WHERE vendor_id IN '
+            '(SELECT id FROM vendors WHERE vendor_name LIKE %(like)s)',
+            'SELECT id FROM products WHERE manufacturer_id IN '
+            '(SELECT id FROM manufacturers WHERE manufacturer_name LIKE %(like)s)',
+            'SELECT id FROM products WHERE category_id IN '
+            '(SELECT id FROM categories WHERE category_name LIKE %(like)s)',
+        ]
+        query += f"    JOIN ({' UNION '.join(matches)}) matched ON matched.id = p.id\n"
+
+    if after is not None:
+        where.append(keyset)
+        params['after_id'] = after['id']
+        field = SORT_FIELDS[sort][0]
+        if field is not None:
+            params['after_value'] = after[field]
+
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += f' ORDER BY {order_by} LIMIT %(limit)s'
+    return query, params
+
+
+@timed('fetch_product_page')
+def fetch_product_page(search='', vendor=None, sort=SORT_NONE, after=None,
+                       limit=CATALOG_PAGE_SIZE):
+    query, params = product_page_query(search, vendor, sort, after, limit)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def fetch_vendor_names():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(VENDOR_NAMES_QUERY)
+        return [row['vendor_name'] for row in cursor.fetchall()]
@@ -93,6 +93,56 @@ INSERT INTO `order_items` VALUES (1,1,1,1),(2,1,2,2),(3,2,3,1),(4,3,4,1),(5,3,5,
 /*!40000 ALTER TABLE `order_items` ENABLE KEYS */;
 UNLOCK TABLES;
 
+/*!50003 SET @saved_sql_mode = @@sql_mode */ ;
+/*!50003 SET sql_mode = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50003 TRIGGER `order_items_stats_insert` AFTER INSERT ON `order_items` FOR EACH ROW BEGIN
+  IF NEW.`product_id` IS NOT NULL THEN
+    INSERT INTO `product_order_stats` (`product_id`, `units_ordered`, `order_lines`, `open_orders`, `last_order_date`)
+    VALUES (NEW.`product_id`, COALESCE(NEW.`amount`, 0), 1,
+            (SELECT COUNT(*) FROM `orders` o WHERE o.`id` = NEW.`order_id` AND COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = o.`status_id`), 0) = 0) * (1 - EXISTS (SELECT 1 FROM `order_items` i WHERE i.`order_id` = NEW.`order_id` AND i.`product_id` = NEW.`product_id` AND i.`id` <> NEW.`id`)),
+            (SELECT o.`order_date` FROM `orders` o WHERE o.`id` = NEW.`order_id`))
+    ON DUPLICATE KEY UPDATE
+      `units_ordered` = `units_ordered` + VALUES(`units_ordered`),
+      `order_lines` = `order_lines` + 1,
+      `open_orders` = `open_orders` + VALUES(`open_orders`),
+      `last_order_date` = GREATEST(COALESCE(`last_order_date`, VALUES(`last_order_date`)),
+                                   COALESCE(VALUES(`last_order_date`), `last_order_date`));
+  END IF;
+END */;;
+/*!50003 CREATE*/ /*!50003 TRIGGER `order_items_stats_update` AFTER UPDATE ON `order_items` FOR EACH ROW BEGIN
+  UPDATE `product_order_stats` SET
+    `units_ordered` = `units_ordered` - COALESCE(OLD.`amount`, 0),
+    `order_lines` = `order_lines` - 1,
+    `open_orders` = `open_orders` - (SELECT COUNT(*) FROM `orders` o WHERE o.`id` = OLD.`order_id` AND COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = o.`status_id`), 0) = 0) * (1 - EXISTS (SELECT 1 FROM `order_items` i WHERE i.`order_id` = OLD.`order_id` AND i.`product_id` = OLD.`product_id` AND i.`id` <> OLD.`id`)),
+    `last_order_date` = (SELECT MAX(o.`order_date`) FROM `order_items` i JOIN `orders` o ON o.`id` = i.`order_id`
+                         WHERE i.`product_id` = OLD.`product_id`)
+  WHERE `product_id` = OLD.`product_id`;
+  IF NEW.`product_id` IS NOT NULL THEN
+    INSERT INTO `product_order_stats` (`product_id`, `units_ordered`, `order_lines`, `open_orders`, `last_order_date`)
+    VALUES (NEW.`product_id`, COALESCE(NEW.`amount`, 0), 1,
+            (SELECT COUNT(*) FROM `orders` o WHERE o.`id` = NEW.`order_id` AND COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = o.`status_id`), 0) = 0) * (1 - EXISTS (SELECT 1 FROM `order_items` i WHERE i.`order_id` = NEW.`order_id` AND i.`product_id` = NEW.`product_id` AND i.`id` <> NEW.`id`)),
+            (SELECT o.`order_date` FROM `orders` o WHERE o.`id` = NEW.`order_id`))
+    ON DUPLICATE KEY UPDATE
+      `units_ordered` = `units_ordered` + VALUES(`units_ordered`),
+      `order_lines` = `order_lines` + 1,
+      `open_orders` = `open_orders` + VALUES(`open_orders`),
+      `last_order_date` = GREATEST(COALESCE(`last_order_date`, VALUES(`last_order_date`)),
+                                   COALESCE(VALUES(`last_order_date`), `last_order_date`));
+  END IF;
+END */;;
+/*!50003 CREATE*/ /*!50003 TRIGGER `order_items_stats_delete` AFTER DELETE ON `order_items` FOR EACH ROW BEGIN
+  UPDATE `product_order_stats` SET
+    `units_ordered` = `units_ordered` - COALESCE(OLD.`amount`, 0),
+    `order_lines` = `order_lines` - 1,
+    `open_orders` = `open_orders` - (SELECT COUNT(*) FROM `orders` o WHERE o.`id` = OLD.`order_id` AND COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = o.`status_id`), 0) = 0) * (1 - EXISTS (SELECT 1 FROM `order_items` i WHERE i.`order_id` = OLD.`order_id` AND i.`product_id` = OLD.`product_id` AND i.`id` <> OLD.`id`)),
+    `last_order_date` = (SELECT MAX(o.`order_date`) FROM `order_items` i JOIN `orders` o ON o.`id` = i.`order_id`
+                         WHERE i.`product_id` = OLD.`product_id`)
+  WHERE `product_id` = OLD.`product_id`;
+END */;;
+DELIMITER ;
+/*!50003 SET sql_mode = @saved_sql_mode */ ;
+
 --
 -- Table structure for table `order_statuses`
 --
@@ -103,6 +153,7 @@ DROP TABLE IF EXISTS `order_statuses`;
 CREATE TABLE `order_statuses` (
   `id` int NOT NULL AUTO_INCREMENT,
   `status_name` varchar(20) DEFAULT NULL,
+  `is_closed` tinyint(1) NOT NULL DEFAULT '0',
   PRIMARY KEY (`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=3 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
@@ -113,7 +164,7 @@ CREATE TABLE `order_statuses` (
 
 LOCK TABLES `order_statuses` WRITE;
 /*!40000 ALTER TABLE `order_statuses` DISABLE KEYS */;
-INSERT INTO `order_statuses` VALUES (1,'Новый'),(2,'Выполнен');
+INSERT INTO `order_statuses` VALUES (1,'Новый',0),(2,'Выполнен',1);
 /*!40000 ALTER TABLE `order_statuses` ENABLE KEYS */;
 UNLOCK TABLES;
 
@@ -152,6 +203,22 @@ INSERT INTO `orders` VALUES (1,3,1,2,111,'2025-03-01','2025-03-10'),(2,4,2,1,222
 /*!40000 ALTER TABLE `orders` ENABLE KEYS */;
 UNLOCK TABLES;
 
+/*!50003 SET @saved_sql_mode = @@sql_mode */ ;
+/*!50003 SET sql_mode = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+/*!50003 CREATE*/ /*!50003 TRIGGER `orders_stats_update` AFTER UPDATE ON `orders` FOR EACH ROW BEGIN
+  IF NOT (NEW.`status_id` <=> OLD.`status_id`) OR NOT (NEW.`order_date` <=> OLD.`order_date`) THEN
+    UPDATE `product_order_stats` st SET
+      st.`open_orders` = st.`open_orders` + (1 - COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = NEW.`status_id`), 0)) - (1 - COALESCE((SELECT s.`is_closed` FROM `order_statuses` s WHERE s.`id` = OLD.`status_id`), 0)),
+      st.`last_order_date` = CASE WHEN NEW.`order_date` <=> OLD.`order_date` THEN st.`last_order_date` ELSE
+        (SELECT MAX(o.`order_date`) FROM `order_items` i JOIN `orders` o ON o.`id` = i.`order_id`
+         WHERE i.`product_id` = st.`product_id`) END
+    WHERE st.`product_id` IN (SELECT i.`product_id` FROM `order_items` i WHERE i.`order_id` = NEW.`id`);
+  END IF;
+END */;;
+DELIMITER ;
+/*!50003 SET sql_mode = @saved_sql_mode */ ;
+
 --
 -- Table structure for table `pickup_points`
 --
@@ -177,6 +244,60 @@ INSERT INTO `pickup_points` VALUES (1,'г. Екатеринбург','ул. Ки
 /*!40000 ALTER TABLE `pickup_points` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `product_deletions`
+--
+
+DROP TABLE IF EXISTS `product_deletions`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `product_deletions` (
+  `product_id` int NOT NULL,
+  `deleted_at` timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (`product_id`),
+  KEY `deleted_at` (`deleted_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `product_deletions`
+--
+
+LOCK TABLES `product_deletions` WRITE;
+/*!40000 ALTER TABLE `product_deletions` DISABLE KEYS */;
+/*!40000 ALTER TABLE `product_deletions` ENABLE KEYS */;
+UNLOCK TABLES;
+
+--
+-- Table structure for table `product_order_stats`
+--
+
+DROP TABLE IF EXISTS `product_order_stats`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `product_order_stats` (
+  `product_id` int NOT NULL,
+  `units_ordered` int NOT NULL DEFAULT '0',
+  `order_lines` int NOT NULL DEFAULT '0',
+  `open_orders` int NOT NULL DEFAULT '0',
+  `last_order_date` date DEFAULT NULL,
+  `updated_at` timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (`product_id`),
+  KEY `updated_at` (`updated_at`),
+  CONSTRAINT `product_order_stats_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `product_order_stats`
+--
+
+LOCK TABLES `product_order_stats` WRITE;
+/*!40000 ALTER TABLE `product_order_stats` DISABLE KEYS */;
+INSERT INTO `product_order_stats` VALUES (1,1,1,0,'2025-03-01','2026-02-19 22:51:02.000000'),(2,2,1,0,'2025-03-01','2026-02-19 22:51:02.000000'),(3,1,1,1,'2025-03-05','2026-02-19 22:51:02.000000'),(4,1,1,0,'2025-03-12','2026-02-19 22:51:02.000000'),(5,2,1,0,'2025-03-12','2026-02-19 22:51:02.000000');
+/*!40000 ALTER TABLE `product_order_stats` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `products`
 --
@@ -197,10 +318,17 @@ CREATE TABLE `products` (
   `vendor_id` int DEFAULT NULL,
   `manufacturer_id` int DEFAULT NULL,
   `category_id` int DEFAULT NULL,
+  `updated_at` timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  `version` int NOT NULL DEFAULT '1',
   PRIMARY KEY (`id`),
+  UNIQUE KEY `article` (`article`),
   KEY `vendor_id` (`vendor_id`),
   KEY `manufacturer_id` (`manufacturer_id`),
   KEY `category_id` (`category_id`),
+  KEY `updated_at` (`updated_at`),
+  KEY `vendor_quantity` (`vendor_id`,`quantity`,`id`),
+  KEY `quantity` (`quantity`,`id`),
+  FULLTEXT KEY `ft_products_search` (`product_name`,`description`,`article`,`size`) /*!50100 WITH PARSER `ngram` */ ,
   CONSTRAINT `products_ibfk_1` FOREIGN KEY (`vendor_id`) REFERENCES `vendors` (`id`),
   CONSTRAINT `products_ibfk_2` FOREIGN KEY (`manufacturer_id`) REFERENCES `manufacturers` (`id`),
   CONSTRAINT `products_ibfk_3` FOREIGN KEY (`category_id`) REFERENCES `categories` (`id`)
@@ -213,10 +341,35 @@ CREATE TABLE `products` (
 
 LOCK TABLES `products` WRITE;
 /*!40000 ALTER TABLE `products` DISABLE KEYS */;
-INSERT INTO `products` VALUES (1,'SN001','Кроссовки Air','42',7200,15,8,'Мужские кроссовки для повседневной носки','1.jpg',1,1,2),(2,'SN002','Кеды Classic','38',4800,0,12,'Женские кеды текстильные','2.jpg',2,5,1),(3,'SN003','Ботинки Winter','41',9500,20,5,'Зимние ботинки с мехом','3.jpg',1,3,2),(4,'SN004','Туфли Elegant','37',6100,8,6,'Женские классические туфли','4.jpg',2,4,1),(5,'SN005','Кроссовки Sport','43',8300,12,7,'Спортивные кроссовки','',1,2,2);
+INSERT INTO `products` VALUES (1,'SN001','Кроссовки Air','42',7200,15,8,'Мужские кроссовки для повседневной носки','1.jpg',1,1,2,'2026-02-19 22:51:02.000000',1),(2,'SN002','Кеды Classic','38',4800,0,12,'Женские кеды текстильные','2.jpg',2,5,1,'2026-02-19 22:51:02.000000',1),(3,'SN003','Ботинки Winter','41',9500,20,5,'Зимние ботинки с мехом','3.jpg',1,3,2,'2026-02-19 22:51:02.000000',1),(4,'SN004','Туфли Elegant','37',6100,8,6,'Женские классические туфли','4.jpg',2,4,1,'2026-02-19 22:51:02.000000',1),(5,'SN005','Кроссовки Sport','43',8300,12,7,'Спортивные кроссовки','',1,2,2,'2026-02-19 22:51:02.000000',1);
 /*!40000 ALTER TABLE `products` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `schema_migrations`
+--
+
+DROP TABLE IF EXISTS `schema_migrations`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `schema_migrations` (
+  `version` int NOT NULL,
+  `name` varchar(100) NOT NULL,
+  `applied_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `schema_migrations`
+--
+
+LOCK TABLES `schema_migrations` WRITE;
+/*!40000 ALTER TABLE `schema_migrations` DISABLE KEYS */;
+INSERT INTO `schema_migrations` VALUES (1,'product_sync','2026-10-17 12:00:00'),(2,'products_fulltext','2026-10-17 12:00:00'),(3,'product_version','2026-10-17 12:00:00'),(4,'order_status_closed','2026-10-17 12:00:00'),(5,'product_order_stats','2026-10-17 12:00:00'),(6,'query_indexes','2026-10-17 12:00:00'),(7,'persist_articles','2026-10-17 12:00:00');
+/*!40000 ALTER TABLE `schema_migrations` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `users`
 --
@@ -232,7 +385,8 @@ CREATE TABLE `users` (
   `login` varchar(40) DEFAULT NULL,
   `password` varchar(40) DEFAULT NULL,
   `role` varchar(30) DEFAULT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `login` (`login`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -256,7 +410,8 @@ DROP TABLE IF EXISTS `vendors`;
 CREATE TABLE `vendors` (
   `id` int NOT NULL AUTO_INCREMENT,
   `vendor_name` varchar(50) DEFAULT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `vendor_name` (`vendor_name`)
 ) ENGINE=InnoDB AUTO_INCREMENT=3 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
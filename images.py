@@ -0,0 +1,95 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(APP_DIR, 'images')
+
+THUMBNAIL_SIZE = (80, 80)
+PREVIEW_SIZE = (150, 100)
+DETAIL_SIZE = (300, 200)
+RENDITIONS = (THUMBNAIL_SIZE, PREVIEW_SIZE, DETAIL_SIZE)
+
+ORPHAN_GRACE_SECONDS = 3600
+
+_KEY_RE = re.compile(r'[0-9a-f]{32}')
+
+
+class ImageError(Exception):
+    pass
+
+
+def is_image_key(name) -> bool:
+    return bool(name) and _KEY_RE.fullmatch(str(name)) is not None
+
+
+def rendition_path(key: str, size, image_dir=IMAGE_DIR) -> str:
+    width, height = size
+    return os.path.join(image_dir, key[:2], f'{key}_{width}x{height}.png')
+
+
+def best_rendition(key: str, width: int, height: int, image_dir=IMAGE_DIR):
+    for size in RENDITIONS:
+        if size[0] >= width and size[1] >= height:
+            return rendition_path(key, size, image_dir), size == (width, height)
+    return rendition_path(key, DETAIL_SIZE, image_dir), False
+
+
+def content_key(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(image: QImage, path: str):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    if not image.save(tmp_path, 'PNG'):
+        raise ImageError(f'Не удалось записать {path}')
+    os.replace(tmp_path, path)
+
+
+def ingest(source_path: str, image_dir=IMAGE_DIR) -> str:
+    key = content_key(source_path)
+    paths = [(size, rendition_path(key, size, image_dir)) for size in RENDITIONS]
+    missing = [(size, path) for size, path in paths if not os.path.exists(path)]
+
+    if missing:
+        image = QImage(source_path)
+        if image.isNull():
+            raise ImageError('Не удалось прочитать изображение')
+        os.makedirs(os.path.dirname(paths[0][1]), exist_ok=True)
+        for (width, height), path in missing:
+            _write_atomic(image.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio,
+                                       Qt.TransformationMode.SmoothTransformation), path)
+
+    for _, path in paths:
+        os.utime(path)
+    return key
+
+
+def collect_garbage(referenced, image_dir=IMAGE_DIR, grace=ORPHAN_GRACE_SECONDS) -> int:
+    deadline = time.time() - grace
+    removed = 0
+    for dirpath, _, filenames in os.walk(image_dir, topdown=False):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            key = name.split('_', 1)[0]
+            try:
+                if (name.endswith('.tmp') or key not in referenced) and os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if dirpath != image_dir:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,240 @@
+import functools
+import re
+import sqlite3
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_name VARCHAR(30)
+);
+CREATE TABLE IF NOT EXISTS manufacturers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    manufacturer_name VARCHAR(50)
+);
+CREATE TABLE IF NOT EXISTS vendors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vendor_name VARCHAR(50)
+);
+CREATE TABLE IF NOT EXISTS order_statuses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status_name VARCHAR(20)
+);
+CREATE TABLE IF NOT EXISTS pickup_points (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    city VARCHAR(40),
+    address VARCHAR(60)
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(30),
+    middle_name VARCHAR(30),
+    last_name VARCHAR(30),
+    login VARCHAR(40),
+    password VARCHAR(40),
+    role VARCHAR(30)
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    article VARCHAR(30),
+    product_name VARCHAR(40),
+    size VARCHAR(10),
+    price INT,
+    discount INT,
+    quantity INT,
+    description TEXT,
+    image VARCHAR(45),
+    vendor_id INT REFERENCES vendors (id),
+    manufacturer_id INT REFERENCES manufacturers (id),
+    category_id INT REFERENCES categories (id)
+);
+CREATE INDEX IF NOT EXISTS products_vendor_id ON products (vendor_id);
+CREATE INDEX IF NOT EXISTS products_manufacturer_id ON products (manufacturer_id);
+CREATE INDEX IF NOT EXISTS products_category_id ON products (category_id);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT REFERENCES users (id),
+    pickup_point_id INT REFERENCES pickup_points (id),
+    status_id INT REFERENCES order_statuses (id),
+    code INT,
+    order_date DATE,
+    delivery_date DATE
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INT REFERENCES orders (id),
+    product_id INT REFERENCES products (id),
+    amount INT
+);
+CREATE INDEX IF NOT EXISTS order_items_order_id ON order_items (order_id);
+CREATE INDEX IF NOT EXISTS order_items_product_id ON order_items (product_id);
+'''
+
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S.') + f'{value.microsecond // 1000:03d}'
+
+
+sqlite3.register_adapter(datetime, _timestamp)
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('timestamp', lambda value: datetime.fromisoformat(value.decode()))
+
+
+def translate(query: str) -> str:
+    query = re.sub(r'%\((\w+)\)s', r':\1', query).replace('%s', '?')
+    query = re.sub(r'CURRENT_TIMESTAMP\(6\)\s+AS\s+(\w+)', NOW + r' AS "\1 [timestamp]"', query)
+    query = query.replace('CURRENT_TIMESTAMP(6)', NOW)
+    head, sep, tail = query.partition('ON DUPLICATE KEY UPDATE')
+    if sep:
+        query = head + 'ON CONFLICT DO UPDATE SET' + re.sub(r'VALUES\((\w+)\)', r'excluded.\1', tail)
+    return query
+
+
+@functools.lru_cache(maxsize=256)
+def _like_pattern(pattern):
+    regex = ''.join('.*' if ch == '%' else '.' if ch == '_' else re.escape(ch) for ch in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def _like(pattern, value):
+    if pattern is None or value is None:
+        return None
+    return _like_pattern(pattern).fullmatch(str(value)) is not None
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        self.value ^= value or 0
+
+    def finalize(self):
+        return self.value
+
+
+def _errors(func):
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(0, str(e)) from e
+        except sqlite3.OperationalError as e:
+            raise pymysql.err.OperationalError(0, str(e)) from e
+    return wrapper
+
+
+class Cursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+
+    @_errors
+    def execute(self, query, args=None):
+        if args is None:
+            args = ()
+        elif not isinstance(args, dict):
+            args = tuple(args)
+        self._cursor.execute(translate(query), args)
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        return self.rowcount
+
+    @_errors
+    def executemany(self, query, args):
+        self._cursor.executemany(translate(query), [
+            a if isinstance(a, dict) else tuple(a) for a in args])
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False, timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.create_function('CRC32', 1, lambda v: zlib.crc32(str(v).encode()))
+        self._conn.create_function('CONCAT', -1, lambda *a: None if None in a else ''.join(map(str, a)))
+        self._conn.create_function('CONCAT_WS', -1,
+                                   lambda sep, *a: sep.join(str(v) for v in a if v is not None))
+        self._conn.create_function('LPAD', 3, lambda v, n, pad: None if v is None else str(v).rjust(n, pad)[:n])
+        self._conn.create_function('CHAR_LENGTH', 1, lambda v: None if v is None else len(str(v)))
+        self._conn.create_function('GREATEST', -1, lambda *a: None if None in a else max(a))
+        self._conn.create_function('LIKE', 2, _like, deterministic=True)
+        self._conn.create_aggregate('BIT_XOR', 1, _BitXor)
+        self.open = True
+
+    def cursor(self, cursor_class=None) -> Cursor:
+        return Cursor(self._conn)
+
+    @property
+    def server_status(self):
+        return SERVER_STATUS.SERVER_STATUS_IN_TRANS if self._conn.in_transaction else 0
+
+    def begin(self):
+        self._conn.execute('BEGIN')
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def ping(self, reconnect=True):
+        return True
+
+    def close(self):
+        if self.open:
+            self._conn.close()
+            self.open = False
+
+
+def connect(path) -> Connection:
+    return Connection(path)
+
+
+def create_schema(path, schema=SCHEMA):
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(schema)
+    finally:
+        conn.close()
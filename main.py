@@ -1,15 +1,38 @@
+import bisect
+import functools
+import hashlib
+import importlib.util
+import io
 import os
-import shutil
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict
 
-import pymysql
-from PyQt6 import uic
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QPixmap, QColor
-from PyQt6.QtWidgets import (QApplication, QWidget, QMainWindow, QLabel,
-                             QHBoxLayout, QVBoxLayout, QListWidgetItem,
-                             QMessageBox, QSizePolicy, QFileDialog)
+from PyQt6.QtCore import (Qt, QEvent, QSize, QRect, QAbstractListModel, QModelIndex,
+                          QObject, QRunnable, QThread, QThreadPool, QTimer,
+                          pyqtSignal)
+from PyQt6.QtGui import QPixmap, QPixmapCache, QImage, QColor, QFont, QPalette, QWindow
+from PyQt6.QtWidgets import (QApplication, QWidget, QMainWindow, QMessageBox,
+                             QFileDialog, QStyledItemDelegate, QStyle, QProgressBar,
+                             QTreeWidgetItem)
+
+import db
+import images
+import metrics
+from bulk import export_products, import_products
+from catalog import (CatalogStore, SearchIndex, facet_label_key, normalize,
+                     HIGHLIGHT_OUT_OF_STOCK, HIGHLIGHT_BIG_DISCOUNT)
+from db import (ASSIGN_ARTICLE, CATALOG_PAGE_SIZE, get_connection, fetch_image_names, fetch_product,
+                preload_driver, reference_cache)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVER_SIDE_CATALOG = os.environ.get('LEVELUP_CATALOG_MODE', 'local') == 'server'
+CATALOG_SERVICE_URL = os.environ.get('LEVELUP_CATALOG_SERVICE')
+CATALOG_REPLICA = os.environ.get('LEVELUP_REPLICA', os.path.join(APP_DIR, 'levelup_replica.db'))
+STARTUP_PROBE = os.environ.get('LEVELUP_STARTUP_PROBE') == '1'
 
 
 def exception_hook(extype, value, tb):
@@ -17,172 +40,1166 @@ def exception_hook(extype, value, tb):
     QMessageBox.critical(None, 'Ошибка', str(value))
 
 
-def get_connection():
-    return pymysql.connect(
-        host='localhost',
-        user='root',
-        password='',
-        database='footwear_store',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+class MetricsHotkey(QObject):
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.Type.KeyPress and isinstance(obj, QWindow)
+                and event.key() == Qt.Key.Key_M
+                and event.modifiers() == (Qt.KeyboardModifier.ControlModifier
+                                          | Qt.KeyboardModifier.ShiftModifier)):
+            metrics.dump()
+            return True
+        return False
+
+
+UI_CACHE_DIR = os.path.join(APP_DIR, '.ui_cache')
+
+
+def _form_class(namespace):
+    return next(value for name, value in namespace.items() if name.startswith('Ui_'))
+
+
+@functools.lru_cache(maxsize=None)
+def ui_form(name: str):
+    source = os.path.join(APP_DIR, name)
+    module_name = 'ui_' + os.path.splitext(name)[0]
+    path = os.path.join(UI_CACHE_DIR, module_name + '.py')
+    try:
+        stale = os.path.getmtime(path) < os.path.getmtime(source)
+    except OSError:
+        stale = True
+
+    if stale:
+        from PyQt6 import uic
+
+        code = io.StringIO()
+        uic.compileUi(source, code)
+        try:
+            os.makedirs(UI_CACHE_DIR, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(code.getvalue())
+            os.replace(tmp_path, path)
+        except OSError:
+            namespace = {}
+            exec(compile(code.getvalue(), source, 'exec'), namespace)
+            return _form_class(namespace)
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return _form_class(vars(module))
+
+
+def setup_ui(widget, name: str):
+    form = ui_form(name)()
+    form.setupUi(widget)
+    for attr, value in vars(form).items():
+        setattr(widget, attr, value)
+
+
+@functools.lru_cache(maxsize=None)
+def catalog_source():
+    if CATALOG_SERVICE_URL:
+        from service import CatalogServiceClient
+        client = CatalogServiceClient(CATALOG_SERVICE_URL)
+        db.configure_references(client)
+        return client
+    if CATALOG_REPLICA and not SERVER_SIDE_CATALOG:
+        from replica import Replica
+        return Replica(CATALOG_REPLICA)
+    return db
+
+
+PLACEHOLDER_IMAGE = 'picture.png'
+THUMBNAIL_DIR = os.path.join(APP_DIR, '.thumbnails')
+THUMBNAIL_MEMORY_BUDGET = 64 * 1024 * 1024
+THUMBNAIL_DISK_BUDGET = 256 * 1024 * 1024
+
+
+def placeholder_pixmap(width: int, height: int) -> QPixmap:
+    key = f'placeholder:{width}x{height}'
+    pix = QPixmapCache.find(key)
+    if pix is None:
+        pix = QPixmap(PLACEHOLDER_IMAGE).scaled(width, height,
+                                                Qt.AspectRatioMode.KeepAspectRatio,
+                                                Qt.TransformationMode.SmoothTransformation)
+        QPixmapCache.insert(key, pix)
+    return pix
+
+
+def prune_thumbnails(cache_dir=THUMBNAIL_DIR, budget=THUMBNAIL_DISK_BUDGET) -> int:
+    files = []
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, cache, key, name, path, width, height, presized=False):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+        self.name = name
+        self.path = path
+        self.width = width
+        self.height = height
+        self.presized = presized
+
+    @metrics.timed('decode_thumbnail')
+    def run(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is None and self.cache.service is not None:
+            image = QImage.fromData(self.cache.service.fetch_image(self.name, self.width, self.height) or b'')
+            if image.width() > self.width or image.height() > self.height:
+                image = image.scaled(self.width, self.height,
+                                     Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+            self.cache._decoded.emit(self.key, self.name, image, 0)
+            return
+        if mtime is None:
+            self.cache._decoded.emit(self.key, self.name, QImage(), 0)
+            return
+        if self.presized:
+            self.cache._decoded.emit(self.key, self.name, QImage(self.path), mtime)
+            return
+        disk_path = self.cache.disk_path(f'{os.path.abspath(self.path)}|{mtime}|{self.width}x{self.height}')
+        image = QImage(disk_path)
+        if image.isNull():
+            image = QImage(self.path)
+            if not image.isNull():
+                image = image.scaled(self.width, self.height,
+                                     Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+                tmp_path = disk_path + '.tmp'
+                if image.save(tmp_path, 'PNG'):
+                    os.replace(tmp_path, disk_path)
+        else:
+            try:
+                os.utime(disk_path)
+            except OSError:
+                pass
+        self.cache._decoded.emit(self.key, self.name, image, mtime)
+
+
+class ThumbnailCache(QObject):
+    ready = pyqtSignal(str)
+    _decoded = pyqtSignal(str, str, QImage, object)
+
+    def __init__(self, memory_budget=THUMBNAIL_MEMORY_BUDGET, cache_dir=THUMBNAIL_DIR,
+                 service=None, parent=None):
+        super().__init__(parent)
+        self.memory_budget = memory_budget
+        self.service = service
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        run_in_background(prune_thumbnails, cache_dir)
+        self._pixmaps = OrderedDict()
+        self._bytes = 0
+        self._pending = set()
+        self._mtimes = {}
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(2, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self._decoded.connect(self._store)
+
+    def disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.png')
+
+    def get(self, name, width: int, height: int):
+        if not name:
+            return placeholder_pixmap(width, height)
+        name = str(name)
+        key = f'{name}|{width}x{height}'
+        pix = self._pixmaps.get(key)
+        if pix is not None:
+            self._pixmaps.move_to_end(key)
+            return pix
+        if key not in self._pending:
+            self._pending.add(key)
+            path, presized = name, False
+            if images.is_image_key(name):
+                path, presized = images.best_rendition(name, width, height)
+            self._pool.start(_ThumbnailJob(self, key, name, path, width, height, presized))
+        return None
+
+    def refresh(self):
+        if self._mtimes:
+            run_in_background(self._changed, dict(self._mtimes), on_done=self._drop)
+
+    @staticmethod
+    def _changed(mtimes):
+        changed = []
+        for key, (name, mtime) in mtimes.items():
+            try:
+                current = os.stat(name).st_mtime_ns
+            except OSError:
+                current = 0
+            if current != mtime:
+                changed.append((key, name, mtime))
+        return changed
+
+    def _drop(self, changed):
+        for key, name, mtime in changed:
+            if self._mtimes.get(key, (name, mtime))[1] != mtime:
+                continue
+            self._mtimes.pop(key, None)
+            pix = self._pixmaps.pop(key, None)
+            if pix is not None:
+                self._bytes -= pix.width() * pix.height() * pix.depth() // 8
+                self.ready.emit(name)
+
+    def _store(self, key, name, image, mtime):
+        self._pending.discard(key)
+        if not images.is_image_key(name):
+            self._mtimes[key] = name, mtime
+        if image.isNull():
+            size = key.rsplit('|', 1)[1].split('x')
+            pix = placeholder_pixmap(int(size[0]), int(size[1]))
+        else:
+            pix = QPixmap.fromImage(image)
+        self._pixmaps[key] = pix
+        self._bytes += pix.width() * pix.height() * pix.depth() // 8
+        while self._bytes > self.memory_budget and len(self._pixmaps) > 1:
+            old_key, old = self._pixmaps.popitem(last=False)
+            self._mtimes.pop(old_key, None)
+            self._bytes -= old.width() * old.height() * old.depth() // 8
+        self.ready.emit(name)
+
+
+_thumbnail_cache = None
 
 
-class ProductWidget(QWidget):
-    def __init__(self, data: dict, thumb_size: int = 80):
-        super().__init__()
-        self.product_id = data['id']
+def thumbnail_cache() -> ThumbnailCache:
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache(service=catalog_source() if CATALOG_SERVICE_URL else None)
+    return _thumbnail_cache
+
+
+def refresh_thumbnails():
+    if _thumbnail_cache is not None:
+        _thumbnail_cache.refresh()
+
+
+PRODUCT_ROLE = Qt.ItemDataRole.UserRole
+PRODUCT_ID_ROLE = Qt.ItemDataRole.UserRole + 1
+
+OUT_OF_STOCK_COLOR = QColor('#ADD8E6')
+BIG_DISCOUNT_COLOR = QColor('#2E8B57')
+
+
+def product_discount(data: dict) -> int:
+    return int(data['discount']) if data['discount'] is not None else 0
+
 
-        discount = int(data['discount']) if data['discount'] is not None else 0
-        quantity = int(data['quantity']) if data['quantity'] is not None else 0
+def product_quantity(data: dict) -> int:
+    return int(data['quantity']) if data['quantity'] is not None else 0
 
-        h = QHBoxLayout(self)
 
-        pix_label = QLabel()
-        pix_label.setFixedSize(QSize(thumb_size, thumb_size))
-        pix_label.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
-        pix = QPixmap(str(data['image'])) if data.get('image') else QPixmap()
-        if pix.isNull():
-            pix = QPixmap('picture.png')
-        pix = pix.scaled(thumb_size, thumb_size,
-                         Qt.AspectRatioMode.KeepAspectRatio,
-                         Qt.TransformationMode.SmoothTransformation)
-        pix_label.setPixmap(pix)
-        h.addWidget(pix_label)
+HIGHLIGHT_COLORS = {
+    HIGHLIGHT_OUT_OF_STOCK: OUT_OF_STOCK_COLOR,
+    HIGHLIGHT_BIG_DISCOUNT: BIG_DISCOUNT_COLOR,
+}
 
-        v = QVBoxLayout()
-        v.addWidget(QLabel(f"{data['category_name']} | {data['product_name']}"))
 
-        desc = QLabel('Описание: ' + str(data['description'] or ''))
-        desc.setWordWrap(True)
-        v.addWidget(desc)
+def row_background(data: dict):
+    if product_quantity(data) == 0:
+        return OUT_OF_STOCK_COLOR
+    if product_discount(data) > 15:
+        return BIG_DISCOUNT_COLOR
+    return None
 
-        v.addWidget(QLabel('Производитель: ' + str(data['manufacturer_name'])))
-        v.addWidget(QLabel('Поставщик: ' + str(data['vendor_name'])))
 
-        price_row = QHBoxLayout()
-        price_label = QLabel('Цена: ' + str(data['price']) + ' руб.')
+class ProductListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._products = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._products)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == PRODUCT_ROLE:
+            return self.product_at(row)
+        if role == PRODUCT_ID_ROLE:
+            return self.product_at(row)['id']
+        if role == Qt.ItemDataRole.DisplayRole:
+            product = self.product_at(row)
+            return f"{product['category_name']} | {product['product_name']}"
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return self.background_at(row)
+        return None
+
+    def product_at(self, row):
+        return self._products[row]
+
+    def background_at(self, row):
+        return row_background(self._products[row])
+
+    @metrics.timed('fill_list')
+    def set_products(self, products):
+        self.beginResetModel()
+        self._products = list(products)
+        self.endResetModel()
+
+    @metrics.timed('append_list')
+    def append_products(self, products):
+        if not products:
+            return
+        first = len(self._products)
+        self.beginInsertRows(QModelIndex(), first, first + len(products) - 1)
+        self._products.extend(products)
+        self.endInsertRows()
+
+    def products(self):
+        return self._products
+
+    def row_of(self, product):
+        try:
+            return self._products.index(product)
+        except ValueError:
+            return -1
+
+    def replace_product(self, row, product):
+        self._products[row] = product
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def refresh_row(self, row):
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def insert_product(self, row, product):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._products.insert(row, product)
+        self.endInsertRows()
+
+    def remove_product(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._products[row]
+        self.endRemoveRows()
+
+    def remove_rows(self, rows):
+        rows = sorted(rows, reverse=True)
+        while rows:
+            last = first = rows.pop(0)
+            while rows and rows[0] == first - 1:
+                first = rows.pop(0)
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._products[first:last + 1]
+            self.endRemoveRows()
+
+
+class ProductDelegate(QStyledItemDelegate):
+    THUMB_SIZE = images.THUMBNAIL_SIZE[0]
+    MARGIN = 6
+    SPACING = 8
+    DESCRIPTION_LINES = 2
+    TEXT_LINES = 6 + DESCRIPTION_LINES
+
+    def sizeHint(self, option, index):
+        text_height = self.TEXT_LINES * option.fontMetrics.height()
+        return QSize(option.rect.width(),
+                     max(self.THUMB_SIZE, text_height) + 2 * self.MARGIN)
+
+    def thumbnail(self, data: dict) -> QPixmap:
+        size = self.THUMB_SIZE
+        pix = thumbnail_cache().get(data.get('image'), size, size)
+        return pix if pix is not None else placeholder_pixmap(size, size)
+
+    def paint(self, painter, option, index):
+        data = index.data(PRODUCT_ROLE)
+        if data is None:
+            super().paint(painter, option, index)
+            return
+
+        painter.save()
+        rect = option.rect
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        background = index.data(Qt.ItemDataRole.BackgroundRole)
+        if selected:
+            painter.fillRect(rect, option.palette.highlight())
+        elif background is not None:
+            painter.fillRect(rect, background)
+        text_color = option.palette.color(
+            QPalette.ColorRole.HighlightedText if selected else QPalette.ColorRole.Text)
+        painter.setPen(text_color)
+
+        size = self.THUMB_SIZE
+        pix = self.thumbnail(data)
+        painter.drawPixmap(rect.left() + self.MARGIN + (size - pix.width()) // 2,
+                           rect.top() + self.MARGIN + (size - pix.height()) // 2, pix)
+
+        fm = option.fontMetrics
+        line = fm.height()
+        discount = product_discount(data)
+        badge = str(discount) + '%'
+        badge_width = fm.horizontalAdvance(badge) + 2 * self.MARGIN
+        painter.drawText(QRect(rect.right() - badge_width, rect.top(), badge_width, rect.height()),
+                         Qt.AlignmentFlag.AlignCenter, badge)
+
+        x = rect.left() + self.MARGIN + size + self.SPACING
+        width = rect.right() - badge_width - self.SPACING - x
+        y = rect.top() + self.MARGIN
+
+        def draw_line(text, lines=1, left=x, flags=Qt.AlignmentFlag.AlignLeft):
+            nonlocal y
+            if lines == 1:
+                text = fm.elidedText(text, Qt.TextElideMode.ElideRight, width - (left - x))
+            painter.drawText(QRect(left, y, width - (left - x), line * lines),
+                             flags | Qt.AlignmentFlag.AlignTop, text)
+            y += line * lines
+
+        draw_line(f"{data['category_name']} | {data['product_name']}")
+        draw_line('Описание: ' + str(data['description'] or ''),
+                  lines=self.DESCRIPTION_LINES, flags=Qt.TextFlag.TextWordWrap)
+        draw_line('Производитель: ' + str(data['manufacturer_name']))
+        draw_line('Поставщик: ' + str(data['vendor_name']))
+
+        price = 'Цена: ' + str(data['price']) + ' руб.'
         if discount > 0:
-            price_label.setStyleSheet('text-decoration: line-through; color: red;')
-            final = float(data['price']) - float(data['price']) * discount / 100
-            final_label = QLabel(f'{final:.2f} руб.')
-            final_label.setStyleSheet('color: black;')
-            price_row.addWidget(price_label)
-            price_row.addWidget(final_label)
+            final = data.get('final_price')
+            if final is None:
+                final = float(data['price']) - float(data['price']) * discount / 100
+            struck = QFont(option.font)
+            struck.setStrikeOut(True)
+            painter.setFont(struck)
+            painter.setPen(QColor('red'))
+            painter.drawText(QRect(x, y, width, line), Qt.AlignmentFlag.AlignLeft, price)
+            painter.setFont(option.font)
+            painter.setPen(text_color)
+            draw_line(f'{final:.2f} руб.', left=x + fm.horizontalAdvance(price) + self.SPACING)
         else:
-            price_row.addWidget(price_label)
-        price_row.addStretch()
-        v.addLayout(price_row)
+            draw_line(price)
+
+        draw_line('Размер: ' + str(data['size']))
+        draw_line('Количество на складе: ' + str(data['quantity']))
+        painter.restore()
+
+
+class CatalogListModel(ProductListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = CatalogStore()
+        self._rows = {}
+
+    def set_store(self, store):
+        self.beginResetModel()
+        self.store = store
+        self._products = []
+        self._rows = {}
+        self.endResetModel()
+
+    def set_products(self, products):
+        self._rows = None
+        super().set_products(products)
+
+    def append_products(self, products):
+        first = len(self._products)
+        super().append_products(products)
+        if self._rows is not None:
+            self._rows.update((pos, row) for row, pos in enumerate(products, first))
+
+    def row_of(self, pos):
+        if self._rows is None:
+            self._rows = {pos: row for row, pos in enumerate(self._products)}
+        return self._rows.get(pos, -1)
+
+    def insert_product(self, row, pos):
+        self._rows = None
+        super().insert_product(row, pos)
+
+    def remove_product(self, row):
+        self._rows = None
+        super().remove_product(row)
+
+    def remove_rows(self, rows):
+        self._rows = None
+        super().remove_rows(rows)
+
+    def product_at(self, row):
+        return self.store.row(self._products[row])
+
+    def background_at(self, row):
+        return HIGHLIGHT_COLORS.get(self.store.highlight[self._products[row]])
+
+
+class ServerProductModel(ProductListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._query = {}
+        self._generation = 0
+        self._fetching = False
+        self._exhausted = True
+
+    def set_query(self, search='', vendor=None, sort=0):
+        self._query = {'search': search, 'vendor': vendor, 'sort': sort}
+        self._generation += 1
+        self._fetching = False
+        self._exhausted = False
+        self.set_products([])
+        self.fetchMore(QModelIndex())
+
+    def reload(self):
+        self.set_query(**self._query)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        after = self._products[-1] if self._products else None
+        run_in_background(self._fetch_page, self._generation, self._query, after,
+                          on_done=self._on_page, on_failed=self._on_page_failed)
+
+    @staticmethod
+    def _fetch_page(generation, query, after):
+        return generation, catalog_source().fetch_product_page(after=after, **query)
+
+    def _on_page(self, result):
+        generation, rows = result
+        if generation != self._generation:
+            return
+        self._fetching = False
+        self._exhausted = len(rows) < CATALOG_PAGE_SIZE
+        self.append_products(rows)
 
-        v.addWidget(QLabel('Размер: ' + str(data['size'])))
-        v.addWidget(QLabel('Количество на складе: ' + str(data['quantity'])))
-        h.addLayout(v)
-        h.addWidget(QLabel(str(discount) + '%'))
+    def _on_page_failed(self, message):
+        self._fetching = False
+        self._exhausted = True
 
+    def row_of_id(self, product_id):
+        for row, product in enumerate(self._products):
+            if product['id'] == product_id:
+                return row
+        return -1
 
-def fetch_products():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.id, p.article, p.product_name, p.size, p.price,
-               p.discount, p.quantity, p.description, p.image,
-               v.vendor_name, m.manufacturer_name, c.category_name
-        FROM products p
-        JOIN vendors v ON p.vendor_id = v.id
-        JOIN manufacturers m ON p.manufacturer_id = m.id
-        JOIN categories c ON p.category_id = c.id
-    ''')
-    products = cursor.fetchall()
-    conn.close()
-    return products
 
+def product_model(list_view, model_class=ProductListModel) -> ProductListModel:
+    model = list_view.model()
+    if not isinstance(model, model_class):
+        model = model_class(list_view)
+        list_view.setModel(model)
+        list_view.setItemDelegate(ProductDelegate(list_view))
+        list_view.setUniformItemSizes(True)
+        thumbnail_cache().ready.connect(list_view.viewport().update)
+    return model
 
-def fill_list(list_widget, products):
-    list_widget.clear()
-    for product in products:
-        discount = int(product['discount']) if product['discount'] is not None else 0
-        quantity = int(product['quantity']) if product['quantity'] is not None else 0
 
-        widget = ProductWidget(product)
-        item = QListWidgetItem()
-        item.setSizeHint(widget.sizeHint())
+def _collect_orphan_images(released):
+    referenced = fetch_image_names()
+    for name in released:
+        if name and name not in referenced and not images.is_image_key(name):
+            path = os.path.realpath(os.path.join(APP_DIR, name))
+            if os.path.dirname(path) == os.path.realpath(APP_DIR) and os.path.isfile(path):
+                os.remove(path)
+    return images.collect_garbage(referenced) + prune_thumbnails()
 
-        if quantity == 0:
-            item.setBackground(QColor('#ADD8E6'))
-        elif discount > 15:
-            item.setBackground(QColor('#2E8B57'))
 
-        list_widget.addItem(item)
-        list_widget.setItemWidget(item, widget)
+def collect_orphan_images(*released):
+    run_in_background(_collect_orphan_images, released)
 
 
+class _TaskSignals(QObject):
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
 
-class ProductForm(QWidget):
-    def __init__(self, parent_admin, product_id=None):
+
+class _Task(QRunnable):
+    def __init__(self, fn, args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.action = metrics.current_action()
+        self.signals = _TaskSignals()
+
+    def run(self):
+        try:
+            with metrics.action(self.action):
+                result = self.fn(*self.args)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.done.emit(result)
+
+
+def run_in_background(fn, *args, on_done=None, on_failed=None):
+    task = _Task(fn, args)
+    if on_done is not None:
+        task.signals.done.connect(on_done)
+    if on_failed is not None:
+        task.signals.failed.connect(on_failed)
+    QThreadPool.globalInstance().start(task)
+
+
+class CatalogLoader(QThread):
+    chunk_loaded = pyqtSignal(object, list)
+    progress = pyqtSignal(object, int, int)
+    failed = pyqtSignal(object, str)
+    done = pyqtSignal(object, object)
+
+    _active = set()
+
+    def __init__(self):
         super().__init__()
-        uic.loadUi('product_form.ui', self)
+        self._cancelled = threading.Event()
+        self._active.add(self)
+        self.finished.connect(self._release)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @metrics.timed('load_catalog')
+    def run(self):
+        synced_at = None
+        try:
+            stream = catalog_source().stream_products(cancelled=self._cancelled.is_set)
+            for rows, loaded, total, synced_at in stream:
+                if self._cancelled.is_set():
+                    stream.close()
+                    return
+                self.chunk_loaded.emit(self, rows)
+                self.progress.emit(self, loaded, total)
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(self, str(e))
+            return
+        if not self._cancelled.is_set():
+            self.done.emit(self, synced_at)
+
+    def _release(self):
+        self._active.discard(self)
+        self.deleteLater()
+
+
+class ChangeListener(QObject):
+    RETRY_SECONDS = 5
+
+    changed = pyqtSignal()
+    references_changed = pyqtSignal()
+
+    def __init__(self, service, parent=None):
+        super().__init__(parent)
+        self.service = service
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                for event, _ in self.service.events():
+                    if event == 'changes':
+                        self.changed.emit()
+                    elif event == 'references':
+                        self.references_changed.emit()
+            except Exception:
+                pass
+            time.sleep(self.RETRY_SECONDS)
+
+
+CATALOG_TTL = float(os.environ.get('LEVELUP_CATALOG_TTL', 30))
+CATALOG_MAX_AGE = float(os.environ.get('LEVELUP_CATALOG_MAX_AGE', 3600))
+CATALOG_KEEP_ALIVE = float(os.environ.get('LEVELUP_CATALOG_KEEP_ALIVE', 120))
+CATALOG_RESET_THRESHOLD = int(os.environ.get('LEVELUP_CATALOG_RESET_THRESHOLD', 200))
+
+
+class CatalogSnapshot(QObject):
+    SYNC_INTERVAL_MS = 5000
+
+    reset = pyqtSignal()
+    chunk_loaded = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    loaded = pyqtSignal()
+    changed = pyqtSignal(list, list)
+    references_changed = pyqtSignal()
+
+    def __init__(self, ttl=CATALOG_TTL, max_age=CATALOG_MAX_AGE, keep_alive=CATALOG_KEEP_ALIVE):
+        super().__init__()
+        self.ttl = ttl
+        self.max_age = max_age
+        self.keep_alive = keep_alive
+        self.store = CatalogStore()
+        self._search_index = None
+        self._loader = None
+        self._loaded_at = None
+        self._checked_at = None
+        self._synced_at = None
+        self._syncing = False
+        self._stale = False
+        self._resync = False
+        self._load_failed = False
+        self._subscribers = 0
+        self._sync_timer = QTimer(self)
+        self._sync_timer.timeout.connect(self.sync)
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.timeout.connect(self._on_idle)
+        self._listener = None
+
+    def search_index(self) -> SearchIndex:
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.store)
+            for pos in self.store.live_positions():
+                self._search_index.add(pos)
+        return self._search_index
+
+    def is_loading(self) -> bool:
+        return self._loader is not None
+
+    def is_syncing(self) -> bool:
+        return self._syncing
+
+    def is_loaded(self) -> bool:
+        return self._synced_at is not None
+
+    def is_fresh(self) -> bool:
+        return (self.is_loaded() and not self._stale
+                and time.monotonic() - self._checked_at < self.ttl)
+
+    def acquire(self):
+        self._subscribers += 1
+        self._load_failed = False
+        self._idle_timer.stop()
+        self._sync_timer.start(self.SYNC_INTERVAL_MS)
+        if CATALOG_SERVICE_URL and self._listener is None:
+            self._listener = ChangeListener(catalog_source(), self)
+            self._listener.changed.connect(self.sync)
+            self._listener.references_changed.connect(self._on_references_changed)
+        if self.is_loading():
+            return
+        if not self.is_loaded() or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+        elif not self.is_fresh():
+            self.sync()
+
+    def release(self):
+        self._subscribers = max(0, self._subscribers - 1)
+        if not self._subscribers:
+            self._sync_timer.stop()
+            self._idle_timer.start(int(self.keep_alive * 1000))
+
+    def _on_idle(self):
+        if not self._subscribers:
+            self.clear()
+
+    def clear(self):
+        if self._loader is not None:
+            self._loader.cancel()
+            self._loader = None
+        self.store = CatalogStore()
+        self._search_index = None
+        self._loaded_at = self._checked_at = self._synced_at = None
+        self._stale = self._resync = False
+        self.reset.emit()
+
+    def invalidate(self):
+        self._stale = True
+        self.sync()
+
+    def load(self):
+        self.clear()
+        loader = CatalogLoader()
+        loader.chunk_loaded.connect(self._on_chunk)
+        loader.progress.connect(self._on_progress)
+        loader.failed.connect(self._on_failed)
+        loader.done.connect(self._on_done)
+        self._loader = loader
+        loader.start()
+
+    def _on_chunk(self, loader, rows):
+        if loader is not self._loader:
+            return
+        positions = self.store.extend(rows)
+        if self._search_index is not None:
+            for pos in positions:
+                self._search_index.add(pos)
+        self.chunk_loaded.emit(positions)
+
+    def _on_progress(self, loader, loaded, total):
+        if loader is self._loader:
+            self.progress.emit(loaded, total)
+
+    def _on_failed(self, loader, message):
+        if loader is not self._loader:
+            return
+        self._loader = None
+        if not self._load_failed:
+            self._load_failed = True
+            self.failed.emit(message)
+
+    def _on_done(self, loader, synced_at):
+        if loader is not self._loader:
+            return
+        self._loader = None
+        self._load_failed = False
+        self._loaded_at = self._checked_at = time.monotonic()
+        self._synced_at = synced_at
+        self._stale = False
+        self.loaded.emit()
+        refresh_thumbnails()
+
+    @metrics.timed('sync_catalog')
+    def sync(self):
+        if self._synced_at is None:
+            if self._subscribers and self._loader is None:
+                self.load()
+            return
+        if self._syncing:
+            self._resync = True
+            return
+        self._syncing = True
+        run_in_background(self._fetch_sync, self._synced_at,
+                          on_done=self._on_synced, on_failed=self._on_sync_failed)
+
+    @staticmethod
+    def _fetch_sync(since):
+        source = catalog_source()
+        references_changed = reference_cache().check()
+        return references_changed, source.fetch_product_changes(since)
+
+    def _on_synced(self, result):
+        self._syncing = False
+        references_changed, changes = result
+        if self._synced_at is None:
+            return
+        if changes is None:
+            self.load()
+            return
+        changed, deleted, synced_at = changes
+        self._synced_at = synced_at
+        self._checked_at = time.monotonic()
+        self._stale = False
+        resync, self._resync = self._resync, False
+        if references_changed:
+            self.references_changed.emit()
+        self.apply_changes(changed, deleted)
+        refresh_thumbnails()
+        if resync:
+            self.sync()
+
+    def _on_sync_failed(self, message):
+        self._syncing = False
+        self._resync = False
+
+    def _on_references_changed(self):
+        reference_cache().invalidate()
+        self.references_changed.emit()
+
+    @metrics.timed('apply_product_changes')
+    def apply_changes(self, changed=(), deleted=()):
+        store = self.store
+        index = self._search_index
+        removed = []
+        for product_id in deleted:
+            pos = store.remove(product_id)
+            if pos is not None:
+                removed.append(pos)
+                if index is not None:
+                    index.remove(pos)
+        stored = []
+        for product in changed:
+            pos = store.position(product['id'])
+            if index is not None and pos is not None:
+                index.remove(pos)
+            pos = store.upsert(product)
+            stored.append(pos)
+            if index is not None:
+                index.add(pos)
+        if removed or stored:
+            self.changed.emit(removed, stored)
+
+
+_catalog_snapshot = None
+
+
+def catalog_snapshot() -> CatalogSnapshot:
+    global _catalog_snapshot
+    if _catalog_snapshot is None:
+        _catalog_snapshot = CatalogSnapshot()
+    return _catalog_snapshot
+
+
+class CatalogWindowMixin:
+    _catalog = None
+    _load_progress = None
+
+    @property
+    def _store(self) -> CatalogStore:
+        return self._catalog.store
+
+    def load_catalog(self):
+        if SERVER_SIDE_CATALOG:
+            product_model(self.lw_products, ServerProductModel).set_query()
+            return
+        if self._catalog is None:
+            self._catalog = catalog_snapshot()
+            for signal, slot in self._catalog_connections():
+                signal.connect(slot)
+            self._catalog.acquire()
+        self._on_catalog_reset()
+        self.on_catalog_chunk(self._store.live_positions())
+        if not self._catalog.is_loading():
+            self._on_catalog_loaded()
+
+    def _catalog_connections(self):
+        catalog = self._catalog
+        return ((catalog.reset, self._on_catalog_reset),
+                (catalog.chunk_loaded, self._on_catalog_chunk),
+                (catalog.progress, self._on_catalog_progress),
+                (catalog.failed, self._on_catalog_failed),
+                (catalog.loaded, self._on_catalog_loaded),
+                (catalog.changed, self._on_catalog_changed),
+                (catalog.references_changed, self.on_references_changed))
+
+    def release_catalog(self):
+        if self._catalog is None:
+            return
+        for signal, slot in self._catalog_connections():
+            signal.disconnect(slot)
+        self._catalog.release()
+        self._catalog = None
+        self._hide_catalog_progress()
+
+    def _show_catalog_progress(self):
+        if self._load_progress is not None:
+            return
+        self._load_progress = QProgressBar()
+        self._load_progress.setMaximumWidth(200)
+        self._load_progress.setRange(0, 0)
+        self.statusBar().showMessage('Загрузка каталога...')
+        self.statusBar().addPermanentWidget(self._load_progress)
+
+    def _hide_catalog_progress(self):
+        if self._load_progress is None:
+            return
+        self.statusBar().removeWidget(self._load_progress)
+        self._load_progress.deleteLater()
+        self._load_progress = None
+        self.statusBar().clearMessage()
+
+    def catalog_model(self) -> CatalogListModel:
+        return product_model(self.lw_products, CatalogListModel)
+
+    def on_catalog_reset(self):
+        pass
+
+    def on_catalog_chunk(self, positions):
+        self.catalog_model().append_products(positions)
+
+    def on_catalog_loaded(self):
+        pass
+
+    def on_catalog_changed(self):
+        pass
+
+    def on_references_changed(self):
+        pass
+
+    def position_matches(self, pos):
+        return True
+
+    def matching_positions(self, positions):
+        return [pos for pos in positions if self.position_matches(pos)]
+
+    def sort_key(self):
+        return None
+
+    def sync_catalog(self):
+        if self._catalog is not None:
+            self._catalog.sync()
+
+    def apply_product_changes(self, changed=(), deleted=()):
+        self._catalog.apply_changes(changed, deleted)
+
+    def _on_catalog_reset(self):
+        self.catalog_model().set_store(self._store)
+        self.on_catalog_reset()
+        if self._catalog.is_loading():
+            self._show_catalog_progress()
+
+    @metrics.timed('catalog_chunk')
+    def _on_catalog_chunk(self, positions):
+        self.on_catalog_chunk(positions)
+
+    def _on_catalog_progress(self, loaded, total):
+        if self._load_progress is not None:
+            self._load_progress.setRange(0, total)
+            self._load_progress.setValue(loaded)
+            self.statusBar().showMessage(f'Загрузка каталога: {loaded} из {total}')
+
+    def _on_catalog_failed(self, message):
+        self._hide_catalog_progress()
+        QMessageBox.critical(self, 'Ошибка', 'Не удалось загрузить каталог: ' + message)
+
+    def _on_catalog_loaded(self):
+        self._hide_catalog_progress()
+        self.on_catalog_loaded()
+
+    def _on_catalog_changed(self, removed, stored):
+        model = self.catalog_model()
+        sort = self.sort_key()
+        if len(removed) + len(stored) > CATALOG_RESET_THRESHOLD:
+            matching = set(self.matching_positions(stored))
+            dropped = set(removed).union(stored).difference(matching)
+            positions = [pos for pos in model.products() if pos not in dropped]
+            matching.difference_update(positions)
+            positions.extend(pos for pos in stored if pos in matching)
+            if sort is not None:
+                positions.sort(key=sort)
+            model.set_products(positions)
+            self.on_catalog_changed()
+            return
+
+        rows = [model.row_of(pos) for pos in removed]
+        model.remove_rows([row for row in rows if row >= 0])
+        for pos in stored:
+            row = model.row_of(pos)
+            if not self.position_matches(pos):
+                if row >= 0:
+                    model.remove_product(row)
+            elif row >= 0 and (sort is None or self._in_order(model.products(), row, sort)):
+                model.refresh_row(row)
+            else:
+                if row >= 0:
+                    model.remove_product(row)
+                if sort is not None:
+                    row = bisect.bisect_right(model.products(), sort(pos), key=sort)
+                else:
+                    row = model.rowCount()
+                model.insert_product(row, pos)
+        self.on_catalog_changed()
+
+    @staticmethod
+    def _in_order(positions, row, sort):
+        key = sort(positions[row])
+        return ((row == 0 or sort(positions[row - 1]) <= key)
+                and (row == len(positions) - 1 or key <= sort(positions[row + 1])))
+
+    def closeEvent(self, event):
+        self.release_catalog()
+        super().closeEvent(event)
+
+
+class ProductForm(QWidget):
+    PREVIEW_SIZE = images.PREVIEW_SIZE
+
+    def __init__(self, parent_admin):
+        super().__init__(parent_admin, Qt.WindowType.Window)
+        setup_ui(self, 'product_form.ui')
 
         self.parent_admin = parent_admin
-        self.product_id = product_id
+        self.product_id = None
         self._new_image_path = None
-        self._old_image_path = None
+        self._version = None
+        self._preview_path = None
+        self._references = None
+        thumbnail_cache().ready.connect(self._show_preview)
+
+        self.pb_choose_photo.clicked.connect(self._choose_photo)
+        self.pb_save.clicked.connect(self._save)
+        self.pb_cancel.clicked.connect(self.close)
 
+        self.setWindowModality(Qt.WindowModality.ApplicationModal)
+
+    @metrics.timed('product_form_open')
+    def edit(self, product_id=None):
+        self.product_id = product_id
+        self._new_image_path = None
+        self._version = None
+        self._preview_path = None
+        self.setEnabled(True)
         self._load_references()
 
+        self.lb_id.setVisible(product_id is not None)
+        self.le_id.setVisible(product_id is not None)
+        self.show()
+        self.activateWindow()
         if product_id is None:
-            self.lb_id.hide()
-            self.le_id.hide()
+            self.setWindowTitle('Добавить товар')
+            self._clear_fields()
             self._load_placeholder()
         else:
+            self.setWindowTitle(f'Редактировать товар (ID: {product_id})')
             self._load_product(product_id)
 
-        self.pb_choose_photo.clicked.connect(self._choose_photo)
-        self.pb_save.clicked.connect(self._save)
-        self.pb_cancel.clicked.connect(self.close)
-
-        self.setWindowModality(Qt.WindowModality.ApplicationModal)
+    def _clear_fields(self):
+        self.le_id.clear()
+        self.le_name.clear()
+        self.te_description.clear()
+        self.le_size.clear()
+        self.dsb_price.setValue(0)
+        self.sb_quantity.setValue(0)
+        self.sb_discount.setValue(0)
+        for combo in (self.cb_category, self.cb_manufacturer, self.cb_vendor):
+            combo.setCurrentIndex(0)
 
     def _load_references(self):
-        conn = get_connection()
-        cur = conn.cursor()
+        references = reference_cache().get_all()
+        if references is self._references:
+            return
+        self._references = references
+        self._categories = references['categories']
+        self._manufacturers = references['manufacturers']
+        self._vendors = references['vendors']
 
-        cur.execute('SELECT id, category_name FROM categories ORDER BY category_name')
-        self._categories = cur.fetchall()
+        for combo in (self.cb_category, self.cb_manufacturer, self.cb_vendor):
+            combo.clear()
         for row in self._categories:
             self.cb_category.addItem(row['category_name'], row['id'])
-
-        cur.execute('SELECT id, manufacturer_name FROM manufacturers ORDER BY manufacturer_name')
-        self._manufacturers = cur.fetchall()
         for row in self._manufacturers:
             self.cb_manufacturer.addItem(row['manufacturer_name'], row['id'])
-
-        cur.execute('SELECT id, vendor_name FROM vendors ORDER BY vendor_name')
-        self._vendors = cur.fetchall()
         for row in self._vendors:
             self.cb_vendor.addItem(row['vendor_name'], row['id'])
 
-        conn.close()
-
     def _load_placeholder(self):
-        pix = QPixmap('picture.png')
-        if not pix.isNull():
-            self.lb_photo.setPixmap(
-                pix.scaled(150, 100, Qt.AspectRatioMode.KeepAspectRatio,
-                           Qt.TransformationMode.SmoothTransformation))
+        self.lb_photo.setPixmap(placeholder_pixmap(*self.PREVIEW_SIZE))
+
+    def _show_preview(self, path=None):
+        if path is not None and path != self._preview_path:
+            return
+        pix = thumbnail_cache().get(self._preview_path, *self.PREVIEW_SIZE)
+        self.lb_photo.setPixmap(pix if pix is not None else placeholder_pixmap(*self.PREVIEW_SIZE))
 
     def _load_product(self, product_id):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            SELECT p.*, v.vendor_name, m.manufacturer_name, c.category_name,
-                   p.vendor_id, p.manufacturer_id, p.category_id
-            FROM products p
-            JOIN vendors v ON p.vendor_id = v.id
-            JOIN manufacturers m ON p.manufacturer_id = m.id
-            JOIN categories c ON p.category_id = c.id
-            WHERE p.id = %s
-        ''', (product_id,))
-        p = cur.fetchone()
-        conn.close()
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT p.*, v.vendor_name, m.manufacturer_name, c.category_name,
+                       p.vendor_id, p.manufacturer_id, p.category_id
+                FROM products p
+                JOIN vendors v ON p.vendor_id = v.id
+                JOIN manufacturers m ON p.manufacturer_id = m.id
+                JOIN categories c ON p.category_id = c.id
+                WHERE p.id = %s
+            ''', (product_id,))
+            p = cur.fetchone()
 
         if not p:
             QMessageBox.warning(self, 'Ошибка', 'Товар не найден')
@@ -209,13 +1226,9 @@ class ProductForm(QWidget):
         if idx >= 0:
             self.cb_vendor.setCurrentIndex(idx)
 
-        self._old_image_path = p['image']
-        pix = QPixmap(str(p['image'])) if p.get('image') else QPixmap()
-        if pix.isNull():
-            pix = QPixmap('picture.png')
-        self.lb_photo.setPixmap(
-            pix.scaled(150, 100, Qt.AspectRatioMode.KeepAspectRatio,
-                       Qt.TransformationMode.SmoothTransformation))
+        self._version = p['version']
+        self._preview_path = str(p['image']) if p.get('image') else None
+        self._show_preview()
 
     def _choose_photo(self):
         path, _ = QFileDialog.getOpenFileName(
@@ -225,11 +1238,10 @@ class ProductForm(QWidget):
         if not path:
             return
         self._new_image_path = path
-        pix = QPixmap(path)
-        self.lb_photo.setPixmap(
-            pix.scaled(150, 100, Qt.AspectRatioMode.KeepAspectRatio,
-                       Qt.TransformationMode.SmoothTransformation))
+        self._preview_path = path
+        self._show_preview()
 
+    @metrics.timed('product_form_save')
     def _save(self):
         name = self.le_name.text().strip()
         if not name:
@@ -253,115 +1265,249 @@ class ProductForm(QWidget):
         size = self.le_size.text().strip()
         discount = self.sb_discount.value()
 
-        image_path = self._old_image_path
-
-        if self._new_image_path:
-            ext = os.path.splitext(self._new_image_path)[1]
-            if self.product_id:
-                dest_name = f'product_{self.product_id}{ext}'
+        values = (name, category_id, description, manufacturer_id, vendor_id,
+                  price, size, quantity, discount)
+        self.setEnabled(False)
+        run_in_background(self._write_product, self.product_id, self._version, values,
+                          self._new_image_path,
+                          on_done=self._on_saved, on_failed=self._on_save_failed)
+
+    @staticmethod
+    @metrics.timed('write_product')
+    def _write_product(product_id, version, values, new_image_path):
+        image = images.ingest(new_image_path) if new_image_path else None
+
+        saved = True
+        replaced = None
+        with get_connection() as conn:
+            cur = conn.cursor()
+            if product_id is None:
+                conn.begin()
+                try:
+                    cur.execute('''
+                        INSERT INTO products
+                            (product_name, category_id, description, manufacturer_id,
+                             vendor_id, price, size, quantity, discount, image)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ''', (*values, image))
+                    product_id = cur.lastrowid
+                    cur.execute(ASSIGN_ARTICLE, (product_id,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
             else:
-                dest_name = f'product_new_{os.path.basename(self._new_image_path)}'
-            dest_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), dest_name)
-
-            pix = QPixmap(self._new_image_path)
-            pix = pix.scaled(300, 200, Qt.AspectRatioMode.KeepAspectRatio,
-                             Qt.TransformationMode.SmoothTransformation)
-            pix.save(dest_path)
-
-            if self._old_image_path and self._old_image_path != dest_path:
-                old = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                   self._old_image_path)
-                if os.path.exists(old) and old != dest_path:
-                    try:
-                        os.remove(old)
-                    except Exception:
-                        pass
+                cur.execute('SELECT image FROM products WHERE id = %s AND version = %s',
+                            (product_id, version))
+                current = cur.fetchone()
+                cur.execute('''
+                    UPDATE products
+                    SET product_name = %s, category_id = %s, description = %s,
+                        manufacturer_id = %s, vendor_id = %s, price = %s,
+                        size = %s, quantity = %s, discount = %s, image = COALESCE(%s, image),
+                        version = version + 1
+                    WHERE id = %s AND version = %s
+                ''', (*values, image, product_id, version))
+                if cur.rowcount == 0:
+                    cur.execute('SELECT version FROM products WHERE id = %s', (product_id,))
+                    row = cur.fetchone()
+                    version = row and row['version']
+                    saved = False
+                elif image is not None and current['image'] != image:
+                    replaced = current['image']
+        return saved, fetch_product(product_id), version, replaced
+
+    def _on_saved(self, result):
+        saved, product, version, replaced = result
+        if not saved:
+            self._on_conflict(product, version)
+            return
+        if replaced:
+            collect_orphan_images(replaced)
+        self.parent_admin.apply_product_changes(changed=[product])
+        self.close()
 
-            image_path = dest_name
+    def _on_conflict(self, product, version):
+        self.setEnabled(True)
+        if product is None:
+            QMessageBox.warning(self, 'Ошибка', 'Товар был удалён другим пользователем')
+            self.parent_admin.apply_product_changes(deleted=[self.product_id])
+            self.close()
+            return
+        self.parent_admin.apply_product_changes(changed=[product])
+        answer = QMessageBox.question(
+            self, 'Конфликт изменений',
+            'Товар был изменён другим пользователем. Загрузить актуальные данные?\n'
+            'Нажмите «Нет», чтобы сохранить ваши изменения поверх них.',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if answer == QMessageBox.StandardButton.Yes:
+            self._new_image_path = None
+            self._load_product(self.product_id)
+        else:
+            self._version = version
+            self._save()
 
-        conn = get_connection()
-        cur = conn.cursor()
+    def _on_save_failed(self, message):
+        self.setEnabled(True)
+        QMessageBox.critical(self, 'Ошибка', 'Не удалось сохранить товар: ' + message)
 
-        if self.product_id is None:
-            cur.execute('SELECT MAX(id) as max_id FROM products')
-            row = cur.fetchone()
-            new_id = (row['max_id'] or 0) + 1
 
-            cur.execute('''
-                INSERT INTO products
-                    (id, product_name, category_id, description, manufacturer_id,
-                     vendor_id, price, size, quantity, discount, image, article)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (new_id, name, category_id, description, manufacturer_id,
-                  vendor_id, price, size, quantity, discount, image_path,
-                  f'ART{new_id:04d}'))
-
-            if self._new_image_path and image_path and 'product_new_' in image_path:
-                ext = os.path.splitext(image_path)[1]
-                final_name = f'product_{new_id}{ext}'
-                old_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), image_path)
-                new_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), final_name)
-                if os.path.exists(old_path):
-                    os.rename(old_path, new_path)
-                cur.execute('UPDATE products SET image = %s WHERE id = %s',
-                            (final_name, new_id))
-        else:
-            cur.execute('''
-                UPDATE products
-                SET product_name = %s, category_id = %s, description = %s,
-                    manufacturer_id = %s, vendor_id = %s, price = %s,
-                    size = %s, quantity = %s, discount = %s, image = %s
-                WHERE id = %s
-            ''', (name, category_id, description, manufacturer_id,
-                  vendor_id, price, size, quantity, discount,
-                  image_path, self.product_id))
-
-        conn.commit()
-        conn.close()
-
-        self.parent_admin.refresh_products()
-        self.close()
+class SearchFilterMixin(CatalogWindowMixin):
+    SEARCH_DEBOUNCE_MS = 150
+    FACET_REFRESH_MS = 200
+    FACET_TITLES = (('manufacturer', 'Производитель'), ('category', 'Категория'), ('size', 'Размер'),
+                    ('price_band', 'Цена'), ('discount_band', 'Скидка'), ('in_stock', 'Наличие'))
+    FACETS_IN_CODE_ORDER = ('price_band', 'discount_band', 'in_stock')
 
-class SearchFilterMixin:
-    SEARCH_FIELDS = [
-        'product_name', 'description', 'manufacturer_name',
-        'vendor_name', 'category_name', 'article', 'size'
-    ]
+    @property
+    def _search_index(self) -> SearchIndex:
+        return self._catalog.search_index()
 
     def init_search_filter(self):
-        self._all_products = fetch_products()
-
-        vendors = sorted({p['vendor_name'] for p in self._all_products})
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.timeout.connect(self.apply_filters)
         self.cb_vendor.addItem('Все поставщики')
-        for v in vendors:
-            self.cb_vendor.addItem(v)
 
         self.cb_sort.addItem('Без сортировки')
         self.cb_sort.addItem('Количество ↑')
         self.cb_sort.addItem('Количество ↓')
+        self.cb_sort.addItem('Заказано ↓')
+        self.cb_sort.addItem('Открытые заказы ↓')
 
-        self.le_search.textChanged.connect(self.apply_filters)
+        self.le_search.textChanged.connect(lambda: self._search_timer.start(self.SEARCH_DEBOUNCE_MS))
         self.cb_vendor.currentIndexChanged.connect(self.apply_filters)
         self.cb_sort.currentIndexChanged.connect(self.apply_filters)
         self.pb_show_all.clicked.connect(self.show_all)
 
-        self.apply_filters()
-
-    def refresh_products(self):
-        self._all_products = fetch_products()
-        current_vendor = self.cb_vendor.currentText()
+        self._facet_timer = QTimer(self)
+        self._facet_timer.setSingleShot(True)
+        self._facet_timer.timeout.connect(self.update_facet_counts)
+        self._facet_items = {}
+        for name, title in self.FACET_TITLES:
+            group = QTreeWidgetItem(self.tw_facets, [title])
+            group.setFlags(Qt.ItemFlag.ItemIsEnabled)
+            self._facet_items[name] = (group, {})
+        self.tw_facets.itemChanged.connect(lambda: self.apply_filters())
+
+        self.load_catalog()
+        if self._catalog is not None:
+            self._catalog.search_index()
+        self.on_references_changed()
+
+    def on_references_changed(self):
+        run_in_background(catalog_source().fetch_vendor_names, on_done=self._set_vendor_names)
+
+    def _set_vendor_names(self, names):
+        current = self.cb_vendor.currentText()
         self.cb_vendor.blockSignals(True)
         self.cb_vendor.clear()
         self.cb_vendor.addItem('Все поставщики')
-        vendors = sorted({p['vendor_name'] for p in self._all_products})
-        for v in vendors:
-            self.cb_vendor.addItem(v)
-        idx = self.cb_vendor.findText(current_vendor)
+        self.cb_vendor.addItems(names)
+        idx = self.cb_vendor.findText(current)
         self.cb_vendor.setCurrentIndex(idx if idx >= 0 else 0)
         self.cb_vendor.blockSignals(False)
-        self.apply_filters()
 
-    def show_all(self):
+    def selected_vendor(self):
+        vendor = self.cb_vendor.currentText()
+        return None if vendor == 'Все поставщики' else vendor
+
+    def selected_facets(self):
+        return {name: {code for code, item in items.items()
+                       if item.checkState(0) == Qt.CheckState.Checked}
+                for name, (_, items) in self._facet_items.items()}
+
+    def on_catalog_reset(self):
+        self.tw_facets.blockSignals(True)
+        for group, items in self._facet_items.values():
+            group.takeChildren()
+            items.clear()
+        self.tw_facets.blockSignals(False)
+
+    def on_catalog_chunk(self, positions):
+        self.catalog_model().append_products(self._filter_positions(positions))
+        self._facet_timer.start(self.FACET_REFRESH_MS)
+
+    def on_catalog_loaded(self):
+        if self.cb_sort.currentIndex() != 0:
+            self.apply_filters()
+        else:
+            self.update_facet_counts()
+
+    def on_catalog_changed(self):
+        self._facet_timer.start(self.FACET_REFRESH_MS)
+
+    def _facet_search(self):
+        found = self._search_index.search(self.le_search.text())
+        vendor = self.selected_vendor()
+        if vendor is not None:
+            found = self._store.filter(vendor, found)
+        return self._store.facet_search(self.selected_facets(), found,
+                                        [name for name, _ in self.FACET_TITLES])
+
+    @metrics.timed('update_facet_counts')
+    def update_facet_counts(self):
+        self._facet_timer.stop()
+        self._show_facet_counts(self._facet_search()[1])
+
+    def _show_facet_counts(self, counts):
+        self.tw_facets.blockSignals(True)
+        for name, (group, items) in self._facet_items.items():
+            facet = self._store.facets[name]
+            added = False
+            for code, count in counts[name].items():
+                item = items.get(code)
+                if item is None:
+                    item = items[code] = QTreeWidgetItem()
+                    item.setFlags(Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemIsEnabled)
+                    item.setCheckState(0, Qt.CheckState.Unchecked)
+                    group.addChild(item)
+                    added = True
+                checked = item.checkState(0) == Qt.CheckState.Checked
+                item.setText(0, f'{facet.labels[code]} ({count})')
+                item.setHidden(not facet.counts[code] and not checked)
+                item.setDisabled(not count and not checked)
+            if added:
+                self._sort_facet_items(name, group, items)
+        self.tw_facets.blockSignals(False)
+
+    def _sort_facet_items(self, name, group, items):
+        labels = self._store.facets[name].labels
+        if name in self.FACETS_IN_CODE_ORDER:
+            key = lambda code: code
+        else:
+            key = lambda code: facet_label_key(labels[code])
+        group.takeChildren()
+        group.addChildren([items[code] for code in sorted(items, key=key)])
+
+    def position_matches(self, pos):
+        return bool(self._filter_positions([pos]))
+
+    def matching_positions(self, positions):
+        return self._filter_positions(positions)
+
+    def sort_key(self):
+        field, _, descending = db.SORT_FIELDS[self.cb_sort.currentIndex()]
+        if field is None:
+            return None
+        values = getattr(self._store, field)
+        if descending:
+            return lambda pos: -values[pos]
+        return values.__getitem__
+
+    @metrics.timed('refresh_products')
+    def refresh_products(self, product_id=None):
+        if product_id is not None:
+            product = fetch_product(product_id)
+            if product is not None:
+                self.apply_product_changes(changed=[product])
+            else:
+                self.apply_product_changes(deleted=[product_id])
+        self.sync_catalog()
+
+    def reset_filters(self):
+        self._search_timer.stop()
         self.le_search.blockSignals(True)
         self.cb_vendor.blockSignals(True)
         self.cb_sort.blockSignals(True)
@@ -374,184 +1520,328 @@ class SearchFilterMixin:
         self.cb_vendor.blockSignals(False)
         self.cb_sort.blockSignals(False)
 
-        fill_list(self.lw_products, self._all_products)
+        self.tw_facets.blockSignals(True)
+        for _, items in self._facet_items.values():
+            for item in items.values():
+                item.setCheckState(0, Qt.CheckState.Unchecked)
+        self.tw_facets.blockSignals(False)
 
-    def apply_filters(self):
-        search = self.le_search.text().strip().lower()
-        vendor = self.cb_vendor.currentText()
-        sort_idx = self.cb_sort.currentIndex()
+    def show_all(self):
+        self.reset_filters()
+        self.catalog_model().set_products(self._store.live_positions())
+        self.update_facet_counts()
+
+    def _filter_positions(self, positions):
+        search = normalize(self.le_search.text().strip())
+        vendor = self.selected_vendor()
 
-        result = self._all_products
+        result = positions
 
-        if vendor != 'Все поставщики':
-            result = [p for p in result if p['vendor_name'] == vendor]
+        if vendor is not None:
+            result = self._store.filter(vendor, result)
 
         if search:
-            filtered = []
-            for p in result:
-                for field in self.SEARCH_FIELDS:
-                    val = str(p.get(field) or '').lower()
-                    if search in val:
-                        filtered.append(p)
-                        break
-            result = filtered
+            result = [pos for pos in result if self._search_index.matches(pos, search)]
+
+        selection = self.selected_facets()
+        if any(selection.values()):
+            result = [pos for pos in result if self._store.facet_matches(pos, selection)]
+
+        return result
+
+    @metrics.timed('apply_filters')
+    def apply_filters(self):
+        self._search_timer.stop()
+        self._facet_timer.stop()
+        result, counts = self._facet_search()
+        self._show_facet_counts(counts)
+
+        field, _, descending = db.SORT_FIELDS[self.cb_sort.currentIndex()]
+        if field is not None:
+            result = self._store.sort(result, field, descending)
+
+        self.catalog_model().set_products(result)
+
+
+class ServerSearchFilterMixin(SearchFilterMixin):
+    def init_search_filter(self):
+        super().init_search_filter()
+        self.tw_facets.hide()
+
+    def show_all(self):
+        self.reset_filters()
+        self.apply_filters()
+
+    @metrics.timed('apply_filters')
+    def apply_filters(self):
+        self._search_timer.stop()
+        product_model(self.lw_products, ServerProductModel).set_query(
+            search=self.le_search.text(),
+            vendor=self.selected_vendor(),
+            sort=self.cb_sort.currentIndex())
+
+    @metrics.timed('apply_product_changes')
+    def apply_product_changes(self, changed=(), deleted=()):
+        model = product_model(self.lw_products, ServerProductModel)
+        deleted = set(deleted)
+        if deleted:
+            model.remove_rows([row for row, product in enumerate(model.products())
+                               if product['id'] in deleted])
+        for product in changed:
+            row = model.row_of_id(product['id'])
+            if row >= 0 and self.cb_sort.currentIndex() == 0:
+                model.replace_product(row, product)
+            else:
+                model.reload()
+                return
+
+    @metrics.timed('refresh_products')
+    def refresh_products(self, product_id=None):
+        if product_id is not None:
+            product = fetch_product(product_id)
+            if product is not None:
+                self.apply_product_changes(changed=[product])
+            else:
+                self.apply_product_changes(deleted=[product_id])
 
-        if sort_idx == 1:
-            result = sorted(result, key=lambda p: int(p['quantity'] or 0))
-        elif sort_idx == 2:
-            result = sorted(result, key=lambda p: int(p['quantity'] or 0), reverse=True)
 
-        fill_list(self.lw_products, result)
+CatalogFilterMixin = ServerSearchFilterMixin if SERVER_SIDE_CATALOG else SearchFilterMixin
 
 
-class Guest(QMainWindow):
+class Guest(CatalogWindowMixin, QMainWindow):
     def __init__(self, login_window):
         super().__init__()
-        uic.loadUi('guest.ui', self)
+        setup_ui(self, 'guest.ui')
         self.login_window = login_window
         self.pb_exit.clicked.connect(self.exit)
-        fill_list(self.lw_products, fetch_products())
+        self.load_catalog()
 
     def exit(self):
-        self.login_window.show()
-        self.close()
+        self.login_window.logout()
 
 
-class Client(QMainWindow):
+class Client(CatalogWindowMixin, QMainWindow):
     def __init__(self, user: dict, login_window):
         super().__init__()
-        uic.loadUi('client.ui', self)
+        setup_ui(self, 'client.ui')
         self.login_window = login_window
         self.lb_fio.setText(f"{user['last_name']} {user['first_name']} {user['middle_name']}")
         self.pb_exit.clicked.connect(self.exit)
-        fill_list(self.lw_products, fetch_products())
+        self.load_catalog()
 
     def exit(self):
-        self.login_window.show()
-        self.close()
+        self.login_window.logout()
 
 
-class Manager(SearchFilterMixin, QMainWindow):
+class Manager(CatalogFilterMixin, QMainWindow):
     def __init__(self, user: dict, login_window):
         super().__init__()
-        uic.loadUi('manager.ui', self)
+        setup_ui(self, 'manager.ui')
         self.login_window = login_window
         self.lb_fio.setText(f"{user['last_name']} {user['first_name']} {user['middle_name']}")
         self.pb_exit.clicked.connect(self.exit)
         self.init_search_filter()
 
     def exit(self):
-        self.login_window.show()
-        self.close()
+        self.login_window.logout()
 
 
-class Admin(SearchFilterMixin, QMainWindow):
+class Admin(CatalogFilterMixin, QMainWindow):
     def __init__(self, user: dict, login_window):
         super().__init__()
-        uic.loadUi('admin.ui', self)
+        setup_ui(self, 'admin.ui')
         self.login_window = login_window
         self.lb_fio.setText(f"{user['last_name']} {user['first_name']} {user['middle_name']}")
         self.pb_exit.clicked.connect(self.exit)
-        self._edit_window = None
+        self._product_form = None
         self.init_search_filter()
 
         self.pb_add.clicked.connect(self._add_product)
-        self.pb_delete.clicked.connect(self._delete_product)
-        self.lw_products.itemDoubleClicked.connect(self._edit_product)
+        self.pb_delete.clicked.connect(self._delete_products)
+        self.pb_import.clicked.connect(self._import_products)
+        self.pb_export.clicked.connect(self._export_products)
+        self.lw_products.doubleClicked.connect(self._edit_product)
+
+    def product_form(self) -> ProductForm:
+        if self._product_form is None:
+            self._product_form = ProductForm(self)
+        return self._product_form
 
     def _add_product(self):
-        if self._edit_window is not None and self._edit_window.isVisible():
-            self._edit_window.activateWindow()
+        form = self.product_form()
+        if form.isVisible():
+            form.activateWindow()
             return
-        self._edit_window = ProductForm(self, product_id=None)
-        self._edit_window.setWindowTitle('Добавить товар')
-        self._edit_window.show()
+        form.edit()
 
-    def _edit_product(self, item):
-        if self._edit_window is not None and self._edit_window.isVisible():
-            self._edit_window.activateWindow()
+    def _edit_product(self, index):
+        form = self.product_form()
+        if form.isVisible():
+            form.activateWindow()
             return
-        widget = self.lw_products.itemWidget(item)
-        if widget is None:
+        product_id = index.data(PRODUCT_ID_ROLE)
+        if product_id is None:
             return
-        product_id = widget.product_id
-        self._edit_window = ProductForm(self, product_id=product_id)
-        self._edit_window.setWindowTitle(f'Редактировать товар (ID: {product_id})')
-        self._edit_window.show()
+        form.edit(product_id)
 
-    def _delete_product(self):
-        item = self.lw_products.currentItem()
-        if item is None:
+    @metrics.timed('delete_product')
+    def _delete_products(self):
+        product_ids = sorted({index.data(PRODUCT_ID_ROLE)
+                              for index in self.lw_products.selectionModel().selectedIndexes()})
+        if not product_ids:
             QMessageBox.warning(self, 'Удаление', 'Выберите товар для удаления')
             return
 
-        widget = self.lw_products.itemWidget(item)
-        if widget is None:
-            return
-        product_id = widget.product_id
-
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT COUNT(*) as cnt FROM order_items WHERE order_id = %s',
-                    (product_id,))
-        row = cur.fetchone()
-        if row and row['cnt'] > 0:
-            conn.close()
-            QMessageBox.warning(self, 'Удаление',
-                                'Нельзя удалить товар, который присутствует в заказе')
-            return
-
+        if len(product_ids) == 1:
+            question = 'Вы уверены, что хотите удалить этот товар?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные товары ({len(product_ids)})?'
         reply = QMessageBox.question(
-            self, 'Подтверждение',
-            'Вы уверены, что хотите удалить этот товар?',
+            self, 'Подтверждение', question,
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         if reply != QMessageBox.StandardButton.Yes:
-            conn.close()
             return
 
-        cur.execute('SELECT image FROM products WHERE id = %s', (product_id,))
-        prod = cur.fetchone()
-        image_path = prod['image'] if prod else None
+        self.pb_delete.setEnabled(False)
+        run_in_background(self._remove_products, product_ids,
+                          on_done=self._on_products_deleted, on_failed=self._on_delete_failed)
+
+    @staticmethod
+    @metrics.timed('remove_products')
+    def _remove_products(product_ids):
+        with get_connection() as conn:
+            cur = conn.cursor()
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            conn.begin()
+            try:
+                cur.execute(f'SELECT product_id FROM product_order_stats '
+                            f'WHERE product_id IN ({placeholders}) AND order_lines > 0', product_ids)
+                ordered = {row['product_id'] for row in cur.fetchall()}
+                deleted = [product_id for product_id in product_ids if product_id not in ordered]
+                image_names = []
+                if deleted:
+                    placeholders = ', '.join(['%s'] * len(deleted))
+                    cur.execute(f'SELECT image FROM products WHERE id IN ({placeholders})', deleted)
+                    image_names = [row['image'] for row in cur.fetchall() if row['image']]
+                    cur.execute(f'DELETE FROM products WHERE id IN ({placeholders})', deleted)
+                    cur.executemany('''
+                        INSERT INTO product_deletions (product_id) VALUES (%s)
+                        ON DUPLICATE KEY UPDATE deleted_at = CURRENT_TIMESTAMP(6)
+                    ''', [(product_id,) for product_id in deleted])
+                    db.prune_deletions(cur)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return deleted, sorted(ordered), image_names
+
+    def _on_products_deleted(self, result):
+        deleted, ordered, image_names = result
+        self.pb_delete.setEnabled(True)
+        if image_names:
+            collect_orphan_images(*image_names)
+        self.apply_product_changes(deleted=deleted)
+        if ordered:
+            if len(ordered) == 1 and not deleted:
+                message = 'Нельзя удалить товар, который присутствует в заказе'
+            else:
+                message = (f'Удалено товаров: {len(deleted)}. Не удалены товары, '
+                           f'которые присутствуют в заказах: {len(ordered)}')
+            QMessageBox.warning(self, 'Удаление', message)
+
+    def _on_delete_failed(self, message):
+        self.pb_delete.setEnabled(True)
+        QMessageBox.critical(self, 'Ошибка', 'Не удалось удалить товары: ' + message)
+
+    BULK_FILTER = 'Файлы товаров (*.csv *.json)'
+    MAX_REPORTED_ERRORS = 20
+
+    def _set_bulk_running(self, message):
+        self.pb_import.setEnabled(message is None)
+        self.pb_export.setEnabled(message is None)
+        if message is None:
+            self.statusBar().clearMessage()
+        else:
+            self.statusBar().showMessage(message)
 
-        cur.execute('DELETE FROM products WHERE id = %s', (product_id,))
-        conn.commit()
-        conn.close()
+    def _import_products(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Импорт товаров', '', self.BULK_FILTER)
+        if not path:
+            return
+        self._set_bulk_running('Импорт товаров...')
+        run_in_background(import_products, path,
+                          on_done=self._on_import_done, on_failed=self._on_bulk_failed)
+
+    def _on_import_done(self, result):
+        self._set_bulk_running(None)
+        catalog_snapshot().invalidate()
+        if not result.errors:
+            QMessageBox.information(self, 'Импорт', result.summary())
+            return
+        lines = [f'Строка {line}: {message}' for line, message in result.errors[:self.MAX_REPORTED_ERRORS]]
+        if len(result.errors) > self.MAX_REPORTED_ERRORS:
+            lines.append(f'... и еще {len(result.errors) - self.MAX_REPORTED_ERRORS}')
+        QMessageBox.warning(self, 'Импорт', result.summary() + '\n\n' + '\n'.join(lines))
 
-        if image_path:
-            full = os.path.join(os.path.dirname(os.path.abspath(__file__)), image_path)
-            if os.path.exists(full):
-                try:
-                    os.remove(full)
-                except Exception:
-                    pass
+    def _export_products(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Экспорт товаров', 'products.csv', self.BULK_FILTER)
+        if not path:
+            return
+        self._set_bulk_running('Экспорт товаров...')
+        run_in_background(export_products, path,
+                          on_done=self._on_export_done, on_failed=self._on_bulk_failed)
+
+    def _on_export_done(self, count):
+        self._set_bulk_running(None)
+        QMessageBox.information(self, 'Экспорт', f'Выгружено товаров: {count}')
 
-        self.refresh_products()
+    def _on_bulk_failed(self, message):
+        self._set_bulk_running(None)
+        QMessageBox.critical(self, 'Ошибка', message)
 
     def exit(self):
-        self.login_window.show()
-        self.close()
+        self.login_window.logout()
 
 
 class Login(QWidget):
     def __init__(self):
         super().__init__()
-        uic.loadUi('login.ui', self)
+        setup_ui(self, 'login.ui')
+        self.window = None
         self.pb_login.clicked.connect(self.login)
         self.pb_guest.clicked.connect(self.guest)
 
+    def _open_window(self, window):
+        self._close_window()
+        window.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        window.destroyed.connect(self._forget_window)
+        self.window = window
+        window.show()
+        self.hide()
+
+    def _close_window(self):
+        window, self.window = self.window, None
+        if window is not None:
+            window.destroyed.disconnect(self._forget_window)
+            window.close()
+
+    def _forget_window(self):
+        self.window = None
+
+    def logout(self):
+        self._close_window()
+        self.show()
+
+    @metrics.timed('login')
     def login(self):
         login = self.le_login.text()
         password = self.le_password.text()
 
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM users WHERE login = %s AND password = %s',
-            (login, password)
-        )
-        user = cursor.fetchone()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(db.LOGIN_QUERY, (login, password))
+            user = cursor.fetchone()
 
         if not user:
             QMessageBox.warning(self, 'Ошибка', 'Неверный логин или пароль')
@@ -559,28 +1849,37 @@ class Login(QWidget):
 
         role = user['role']
         if role == 'Администратор':
-            self.window = Admin(user, self)
+            window = Admin(user, self)
         elif role == 'Менеджер':
-            self.window = Manager(user, self)
+            window = Manager(user, self)
         elif role == 'Клиент':
-            self.window = Client(user, self)
+            window = Client(user, self)
         else:
             QMessageBox.warning(self, 'Ошибка', f'Неизвестная роль: {role}')
             return
 
-        self.window.show()
-        self.hide()
+        self._open_window(window)
         self.le_password.clear()
         self.le_login.clear()
 
     def guest(self):
-        self.window = Guest(self)
-        self.window.show()
-        self.hide()
+        self._open_window(Guest(self))
+
+def report_startup():
+    print(f'startup_ready {time.time():.6f}', flush=True)
+    QApplication.quit()
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     sys.excepthook = exception_hook
+    if metrics.ENABLED:
+        metrics_hotkey = MetricsHotkey(app)
+        app.installEventFilter(metrics_hotkey)
+        app.aboutToQuit.connect(lambda: app.removeEventFilter(metrics_hotkey))
     window = Login()
     window.show()
+    threading.Thread(target=preload_driver, daemon=True).start()
+    if STARTUP_PROBE:
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec())
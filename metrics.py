@@ -0,0 +1,237 @@
+import atexit
+import contextlib
+import functools
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENABLED = os.environ.get('LEVELUP_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+METRICS_FILE = os.environ.get('LEVELUP_METRICS_FILE', os.path.join(APP_DIR, 'levelup_metrics.json'))
+SLOW_QUERY_LOG = os.environ.get('LEVELUP_SLOW_QUERY_LOG', os.path.join(APP_DIR, 'levelup_slow_queries.log'))
+SLOW_QUERY_MS = float(os.environ.get('LEVELUP_SLOW_QUERY_MS', 100))
+
+MAX_SAMPLES = 10000
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def summarize(samples, total, count):
+    ordered = sorted(samples)
+    result = {
+        'count': count,
+        'total_ms': round(total * 1000, 3),
+        'mean_ms': round(total / count * 1000, 3) if count else 0,
+    }
+    for p in (50, 95, 99):
+        if ordered:
+            result[f'p{p}_ms'] = round(ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1] * 1000, 3)
+    if ordered:
+        result['max_ms'] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+class _Stat:
+    __slots__ = ('count', 'total', 'samples', 'rows')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = []
+        self.rows = 0
+
+    def add(self, duration, rows=0):
+        self.count += 1
+        self.total += duration
+        self.rows += rows
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(duration)
+        else:
+            self.samples[self.count % MAX_SAMPLES] = duration
+
+    def report(self):
+        return summarize(self.samples, self.total, self.count)
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans = {}
+        self._queries = {}
+        self._actions = {}
+        self._slow_queries = 0
+
+    def current_action(self):
+        return getattr(self._local, 'action', None)
+
+    @contextlib.contextmanager
+    def action(self, name):
+        previous = self.current_action()
+        self._local.action = name
+        try:
+            yield
+        finally:
+            self._local.action = previous
+
+    @contextlib.contextmanager
+    def span(self, name):
+        outermost = self.current_action() is None
+        if outermost:
+            self._local.action = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self._spans.setdefault(name, _Stat()).add(duration)
+                if outermost:
+                    self._action(name)['count'] += 1
+            if outermost:
+                self._local.action = None
+
+    def _action(self, name):
+        action = self._actions.get(name)
+        if action is None:
+            action = self._actions[name] = {'count': 0, 'queries': 0, 'query_ms': 0.0}
+        return action
+
+    def record_query(self, query, duration, rows):
+        action = self.current_action() or 'background'
+        text = normalize_query(query)
+        with self._lock:
+            self._queries.setdefault(text, _Stat()).add(duration, rows)
+            stats = self._action(action)
+            stats['queries'] += 1
+            stats['query_ms'] += duration * 1000
+            if duration * 1000 >= self.slow_query_ms:
+                self._slow_queries += 1
+                self._log_slow_query(text, duration, rows, action)
+
+    def _log_slow_query(self, text, duration, rows, action):
+        try:
+            with open(self.slow_query_log, 'a', encoding='utf-8') as f:
+                f.write(f'{time.strftime("%Y-%m-%d %H:%M:%S")}\t{duration * 1000:.1f} ms\t'
+                        f'rows={rows}\taction={action}\t{text}\n')
+        except OSError:
+            pass
+
+    def report(self):
+        with self._lock:
+            queries = sorted(self._queries.items(), key=lambda item: item[1].total, reverse=True)
+            return {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                'uptime_s': round(time.time() - self.started_at, 3),
+                'slow_query_ms': self.slow_query_ms,
+                'slow_queries': self._slow_queries,
+                'spans': {name: stat.report() for name, stat in sorted(self._spans.items())},
+                'queries': [dict(stat.report(), rows=stat.rows, query=text) for text, stat in queries],
+                'actions': {name: dict(count=stats['count'], queries=stats['queries'],
+                                       query_ms=round(stats['query_ms'], 3),
+                                       queries_per_action=round(stats['queries'] / stats['count'], 2)
+                                       if stats['count'] else None)
+                            for name, stats in sorted(self._actions.items())},
+            }
+
+    def dump(self, path=METRICS_FILE):
+        report = self.report()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def _rowcount(self):
+        rowcount = self._cursor.rowcount
+        return rowcount if rowcount is not None and 0 <= rowcount < 2 ** 63 else 0
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            self._metrics.record_query(query, time.perf_counter() - start, self._rowcount())
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            self._metrics.record_query(query, time.perf_counter() - start, self._rowcount())
+
+
+_metrics = Metrics() if ENABLED else None
+
+
+def metrics():
+    return _metrics
+
+
+def instrument(cursor):
+    return InstrumentedCursor(cursor, _metrics) if _metrics is not None else cursor
+
+
+def span(name):
+    return _metrics.span(name) if _metrics is not None else contextlib.nullcontext()
+
+
+def action(name):
+    return _metrics.action(name) if _metrics is not None and name else contextlib.nullcontext()
+
+
+def current_action():
+    return _metrics.current_action() if _metrics is not None else None
+
+
+def timed(name):
+    def decorator(func):
+        if _metrics is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _metrics.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def dump():
+    if _metrics is None:
+        return None
+    path = _metrics.dump()
+    print(f'Метрики записаны в {path}', file=sys.stderr)
+    return path
+
+
+if ENABLED:
+    atexit.register(dump)
@@ -0,0 +1,324 @@
+import importlib.util
+import os
+import re
+import sys
+from datetime import datetime
+
+import db
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(APP_DIR, 'migrations')
+
+MYSQL = 'mysql'
+SQLITE = 'sqlite'
+
+SCHEMA_MIGRATIONS = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+_MIGRATION_RE = re.compile(r'(\d+)_(\w+)\.py')
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_WORDS = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP', 'LIMIT', 'UNION'}
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    def __str__(self):
+        return f'{self.version:04d}_{self.name}'
+
+
+class Schema:
+    Error = MigrationError
+
+    def __init__(self, cursor, dialect=MYSQL):
+        self.cursor = cursor
+        self.dialect = dialect
+
+    def execute(self, query, args=None):
+        self.cursor.execute(query, args)
+
+    def index_name(self, table, name):
+        return name if self.dialect == MYSQL else f'{table}_{name}'
+
+    def has_index(self, table, name) -> bool:
+        if self.dialect == MYSQL:
+            self.execute('SELECT 1 FROM information_schema.statistics '
+                         'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s '
+                         'LIMIT 1', (table, name))
+        else:
+            self.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s",
+                         (self.index_name(table, name),))
+        return self.cursor.fetchone() is not None
+
+    def has_column(self, table, column) -> bool:
+        if self.dialect == MYSQL:
+            self.execute('SELECT 1 FROM information_schema.columns '
+                         'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s '
+                         'LIMIT 1', (table, column))
+        else:
+            self.execute('SELECT 1 FROM pragma_table_info(%s) WHERE name = %s', (table, column))
+        return self.cursor.fetchone() is not None
+
+    def add_column(self, table, column, definition):
+        if not self.has_column(table, column):
+            self.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def drop_column(self, table, column):
+        if self.has_column(table, column):
+            self.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+
+    def create_trigger(self, name, body):
+        self.drop_trigger(name)
+        self.execute(body)
+
+    def drop_trigger(self, name):
+        self.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    def create_index(self, table, name, columns, unique=False):
+        if not self.has_index(table, name):
+            kind = 'UNIQUE INDEX' if unique else 'INDEX'
+            self.execute(f"CREATE {kind} {self.index_name(table, name)} ON {table} ({', '.join(columns)})")
+
+    def drop_index(self, table, name):
+        if self.has_index(table, name):
+            if self.dialect == MYSQL:
+                self.execute(f'DROP INDEX {name} ON {table}')
+            else:
+                self.execute(f'DROP INDEX {self.index_name(table, name)}')
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _MIGRATION_RE.fullmatch(filename)
+        if match is None:
+            continue
+        spec = importlib.util.spec_from_file_location(f'migration_{match[1]}',
+                                                      os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append(Migration(int(match[1]), match[2], module))
+    migrations.sort(key=lambda m: m.version)
+    for previous, migration in zip(migrations, migrations[1:]):
+        if previous.version == migration.version:
+            raise MigrationError(f'Две миграции с номером {migration.version}: {previous}, {migration}')
+    return migrations
+
+
+def applied_versions(cursor):
+    cursor.execute(SCHEMA_MIGRATIONS)
+    cursor.execute('SELECT version FROM schema_migrations ORDER BY version')
+    return [row['version'] for row in cursor.fetchall()]
+
+
+def _run(conn, migration, step, dialect):
+    cursor = conn.cursor()
+    transactional = dialect == SQLITE
+    if transactional:
+        conn.begin()
+    try:
+        getattr(migration.module, step)(Schema(cursor, dialect))
+        if step == 'up':
+            cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)',
+                           (migration.version, migration.name))
+        else:
+            cursor.execute('DELETE FROM schema_migrations WHERE version = %s', (migration.version,))
+        if transactional:
+            conn.commit()
+    except Exception as e:
+        if transactional:
+            conn.rollback()
+        if transactional or isinstance(e, MigrationError):
+            raise
+        raise MigrationError(f'Миграция {migration} прервана: {e}. Изменения схемы в MySQL не '
+                             'откатываются, шаги миграций повторяемы — запустите команду снова') from e
+
+
+def status(directory=MIGRATIONS_DIR):
+    with db.get_connection() as conn:
+        applied = set(applied_versions(conn.cursor()))
+    return [(migration, migration.version in applied) for migration in load_migrations(directory)]
+
+
+def upgrade(conn, target=None, dialect=MYSQL, directory=MIGRATIONS_DIR):
+    migrations = load_migrations(directory)
+    applied = set(applied_versions(conn.cursor()))
+    done = []
+    for migration in migrations:
+        if migration.version in applied or target is not None and migration.version > target:
+            continue
+        _run(conn, migration, 'up', dialect)
+        done.append(migration)
+    return done
+
+
+def migrate(target=None, dialect=MYSQL, directory=MIGRATIONS_DIR):
+    with db.get_connection() as conn:
+        return upgrade(conn, target, dialect, directory)
+
+
+def rollback(target=None, dialect=MYSQL, directory=MIGRATIONS_DIR):
+    migrations = {migration.version: migration for migration in load_migrations(directory)}
+    done = []
+    with db.get_connection() as conn:
+        applied = applied_versions(conn.cursor())
+        if target is None:
+            target = applied[-2] if len(applied) > 1 else 0
+        for version in reversed(applied):
+            if version <= target:
+                break
+            if version not in migrations:
+                raise MigrationError(f'Нет файла миграции {version}')
+            _run(conn, migrations[version], 'down', dialect)
+            done.append(migrations[version])
+    return done
+
+
+def app_queries(dialect=MYSQL):
+    since = datetime.now()
+    after = {'id': 1, 'quantity': 0, 'units_ordered': 0, 'open_orders': 0}
+    queries = [
+        ('login', db.LOGIN_QUERY, ('admin', ''), False),
+        ('fetch_product', db.PRODUCTS_QUERY + ' WHERE p.id = %s', (1,), False),
+        ('fetch_product_changes', db.CHANGED_PRODUCTS_QUERY, {'since': since}, False),
+        ('product_deletions', db.DELETED_PRODUCTS_QUERY, (since,), False),
+        ('existing_articles', *db.existing_articles_query(['SN001', 'ART0002']), False),
+        ('vendor_names', db.VENDOR_NAMES_QUERY, None, False),
+        ('page', *db.product_page_query(after=after), False),
+        ('page_vendor', *db.product_page_query(vendor='-'), False),
+    ]
+    for sort, (field, _, descending) in db.SORT_FIELDS.items():
+        if field is None:
+            continue
+        name = f"page_{field}{'_desc' if descending else ''}"
+        computed = field != 'quantity'
+        queries.append((name, *db.product_page_query(sort=sort), computed))
+        queries.append((name + '_after', *db.product_page_query(sort=sort, after=after), computed))
+        queries.append((name + '_vendor', *db.product_page_query(vendor='-', sort=sort), computed))
+    if dialect == MYSQL:
+        queries.append(('search', *db.product_page_query('кроссовки'), False))
+        queries.append(('search_short', *db.product_page_query('к'), True))
+    return queries
+
+
+def _aliases(query):
+    aliases = {}
+    for table, alias in _TABLE_RE.findall(query):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def query_plan(cursor, query, params=None, dialect=MYSQL):
+    aliases = _aliases(query)
+    plan = []
+    if dialect == MYSQL:
+        cursor.execute('EXPLAIN ' + query, params)
+        rows = cursor.fetchall()
+        ordered = not any('filesort' in (row['Extra'] or '') for row in rows)
+        for row in rows:
+            table = aliases.get(row['table'])
+            scan = (row['type'] in ('ALL', 'index') and table is not None
+                    and table not in db.REFERENCE_TABLES)
+            plan.append((f"{row['table']}: {row['type']}, key={row['key']}, rows={row['rows']}, "
+                         f"{row['Extra'] or ''}".rstrip(', '), scan))
+    else:
+        cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+        rows = cursor.fetchall()
+        ordered = not any('TEMP B-TREE FOR ORDER BY' in row['detail'] for row in rows)
+        for row in rows:
+            detail = row['detail']
+            words = detail.split()
+            table = aliases.get(words[1]) if words[0] == 'SCAN' and len(words) > 1 else None
+            scan = table is not None and table not in db.REFERENCE_TABLES
+            plan.append((detail, scan))
+    bounded = ordered and ' LIMIT ' in query
+    return [(detail, scan and not bounded) for detail, scan in plan]
+
+
+def explain(dialect=MYSQL):
+    report = []
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for name, query, params, expected in app_queries(dialect):
+            report.append((name, query_plan(cursor, query, params, dialect), expected))
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Миграции схемы footwear_store')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='использовать локальную базу SQLite вместо MySQL')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='показать применённые миграции')
+    up_parser = commands.add_parser('up', help='применить миграции')
+    up_parser.add_argument('--to', type=int, metavar='VERSION')
+    down_parser = commands.add_parser('down', help='откатить последнюю миграцию')
+    down_parser.add_argument('--to', type=int, metavar='VERSION',
+                             help='откатить все миграции новее указанной (0 — все)')
+    explain_parser = commands.add_parser('explain',
+                                         help='проверить планы запросов приложения на полный просмотр')
+    explain_parser.add_argument('-v', '--verbose', action='store_true', help='вывести планы целиком')
+    args = parser.parse_args()
+
+    dialect = MYSQL
+    if args.sqlite:
+        import localdb
+        localdb.create_schema(args.sqlite)
+        db.configure_pool(connect=lambda: localdb.connect(args.sqlite))
+        dialect = SQLITE
+
+    try:
+        if args.command == 'status':
+            for migration, applied in status():
+                print(f"{'+' if applied else '-'} {migration}")
+        elif args.command == 'up':
+            done = migrate(args.to, dialect)
+            for migration in done:
+                print(f'Применена {migration}')
+            if not done:
+                print('Схема актуальна')
+        elif args.command == 'down':
+            done = rollback(args.to, dialect)
+            for migration in done:
+                print(f'Откачена {migration}')
+            if not done:
+                print('Нечего откатывать')
+        else:
+            failed = 0
+            for name, plan, expected in explain(dialect):
+                scans = [detail for detail, scan in plan if scan]
+                if scans and not expected:
+                    failed += 1
+                if not scans:
+                    print(f'{name}: ok')
+                else:
+                    print(f"{name}: полный просмотр{' (ожидаемо)' if expected else ''}: "
+                          + '; '.join(scans))
+                if args.verbose:
+                    for detail, _ in plan:
+                        print(f'    {detail}')
+            return 1 if failed else 0
+    except MigrationError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
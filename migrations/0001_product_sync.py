@@ -0,0 +1,58 @@
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+UPDATED_AT = {
+    'mysql': 'timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)',
+    'sqlite': "TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00.000'",
+}
+
+PRODUCT_DELETIONS = {
+    'mysql': '''
+        CREATE TABLE IF NOT EXISTS product_deletions (
+            product_id int NOT NULL,
+            deleted_at timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            PRIMARY KEY (product_id)
+        )
+    ''',
+    'sqlite': f'''
+        CREATE TABLE IF NOT EXISTS product_deletions (
+            product_id INTEGER PRIMARY KEY,
+            deleted_at TIMESTAMP NOT NULL DEFAULT ({NOW})
+        )
+    ''',
+}
+
+SQLITE_TRIGGERS = (
+    ('products_stamp', f'''
+        CREATE TRIGGER products_stamp AFTER INSERT ON products
+        BEGIN
+            UPDATE products SET updated_at = {NOW} WHERE id = NEW.id;
+        END
+    '''),
+    ('products_touch', f'''
+        CREATE TRIGGER products_touch AFTER UPDATE ON products
+        WHEN NEW.updated_at = OLD.updated_at
+        BEGIN
+            UPDATE products SET updated_at = {NOW} WHERE id = NEW.id;
+        END
+    '''),
+)
+
+
+def up(schema):
+    schema.add_column('products', 'updated_at', UPDATED_AT[schema.dialect])
+    schema.create_index('products', 'updated_at', ('updated_at',))
+    schema.execute(PRODUCT_DELETIONS[schema.dialect])
+    schema.create_index('product_deletions', 'deleted_at', ('deleted_at',))
+    if schema.dialect == 'sqlite':
+        schema.execute(f'UPDATE products SET updated_at = {NOW}')
+        for name, body in SQLITE_TRIGGERS:
+            schema.create_trigger(name, body)
+
+
+def down(schema):
+    if schema.dialect == 'sqlite':
+        for name, _ in reversed(SQLITE_TRIGGERS):
+            schema.drop_trigger(name)
+    schema.execute('DROP TABLE IF EXISTS product_deletions')
+    schema.drop_index('products', 'updated_at')
+    schema.drop_column('products', 'updated_at')
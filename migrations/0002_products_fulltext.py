@@ -0,0 +1,8 @@
+def up(schema):
+    if schema.dialect == 'mysql' and not schema.has_index('products', 'ft_products_search'):
+        schema.execute('ALTER TABLE products ADD FULLTEXT INDEX ft_products_search '
+                       '(product_name, description, article, size) WITH PARSER ngram')
+
+
+def down(schema):
+    schema.drop_index('products', 'ft_products_search')
@@ -0,0 +1,6 @@
+def up(schema):
+    schema.add_column('products', 'version', 'int NOT NULL DEFAULT 1')
+
+
+def down(schema):
+    schema.drop_column('products', 'version')
@@ -0,0 +1,17 @@
+CLOSED_STATUSES = ('Выполнен', 'Завершен', 'Отменен')
+
+IS_CLOSED = {
+    'mysql': 'tinyint(1) NOT NULL DEFAULT 0',
+    'sqlite': 'INT NOT NULL DEFAULT 0',
+}
+
+
+def up(schema):
+    schema.add_column('order_statuses', 'is_closed', IS_CLOSED[schema.dialect])
+    placeholders = ', '.join(['%s'] * len(CLOSED_STATUSES))
+    schema.execute(f'UPDATE order_statuses SET is_closed = 1 WHERE status_name IN ({placeholders})',
+                   CLOSED_STATUSES)
+
+
+def down(schema):
+    schema.drop_column('order_statuses', 'is_closed')
@@ -0,0 +1,202 @@
+STATS_TABLE = {
+    'mysql': '''
+        CREATE TABLE IF NOT EXISTS product_order_stats (
+            product_id int NOT NULL,
+            units_ordered int NOT NULL DEFAULT 0,
+            order_lines int NOT NULL DEFAULT 0,
+            open_orders int NOT NULL DEFAULT 0,
+            last_order_date date DEFAULT NULL,
+            updated_at timestamp(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            PRIMARY KEY (product_id),
+            CONSTRAINT product_order_stats_ibfk_1 FOREIGN KEY (product_id)
+                REFERENCES products (id) ON DELETE CASCADE
+        )
+    ''',
+    'sqlite': '''
+        CREATE TABLE IF NOT EXISTS product_order_stats (
+            product_id INTEGER PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE,
+            units_ordered INT NOT NULL DEFAULT 0,
+            order_lines INT NOT NULL DEFAULT 0,
+            open_orders INT NOT NULL DEFAULT 0,
+            last_order_date DATE,
+            updated_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+    ''',
+}
+
+BACKFILL = '''
+    INSERT INTO product_order_stats (product_id, units_ordered, order_lines, open_orders, last_order_date)
+    SELECT i.product_id, COALESCE(SUM(i.amount), 0), COUNT(*),
+           COUNT(DISTINCT CASE WHEN COALESCE(s.is_closed, 0) = 0 THEN o.id END),
+           MAX(o.order_date)
+    FROM order_items i
+    JOIN products p ON p.id = i.product_id
+    LEFT JOIN orders o ON o.id = i.order_id
+    LEFT JOIN order_statuses s ON s.id = o.status_id
+    GROUP BY i.product_id
+'''
+
+TRIGGERS = {
+    'mysql': (
+        ('order_items_stats_insert', '''
+        CREATE TRIGGER order_items_stats_insert AFTER INSERT ON order_items FOR EACH ROW BEGIN
+          IF NEW.product_id IS NOT NULL THEN
+            INSERT INTO product_order_stats (product_id, units_ordered, order_lines, open_orders, last_order_date)
+            VALUES (NEW.product_id, COALESCE(NEW.amount, 0), 1,
+                    (SELECT COUNT(*) FROM orders o WHERE o.id = NEW.order_id AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0) * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = NEW.order_id AND i.product_id = NEW.product_id AND i.id <> NEW.id)),
+                    (SELECT o.order_date FROM orders o WHERE o.id = NEW.order_id))
+            ON DUPLICATE KEY UPDATE
+              units_ordered = units_ordered + VALUES(units_ordered),
+              order_lines = order_lines + 1,
+              open_orders = open_orders + VALUES(open_orders),
+              last_order_date = GREATEST(COALESCE(last_order_date, VALUES(last_order_date)),
+                                           COALESCE(VALUES(last_order_date), last_order_date));
+          END IF;
+        END
+        '''),
+        ('order_items_stats_update', '''
+        CREATE TRIGGER order_items_stats_update AFTER UPDATE ON order_items FOR EACH ROW BEGIN
+          UPDATE product_order_stats SET
+            units_ordered = units_ordered - COALESCE(OLD.amount, 0),
+            order_lines = order_lines - 1,
+            open_orders = open_orders - (SELECT COUNT(*) FROM orders o WHERE o.id = OLD.order_id AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0) * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = OLD.order_id AND i.product_id = OLD.product_id AND i.id <> OLD.id)),
+            last_order_date = (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                                 WHERE i.product_id = OLD.product_id)
+          WHERE product_id = OLD.product_id;
+          IF NEW.product_id IS NOT NULL THEN
+            INSERT INTO product_order_stats (product_id, units_ordered, order_lines, open_orders, last_order_date)
+            VALUES (NEW.product_id, COALESCE(NEW.amount, 0), 1,
+                    (SELECT COUNT(*) FROM orders o WHERE o.id = NEW.order_id AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0) * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = NEW.order_id AND i.product_id = NEW.product_id AND i.id <> NEW.id)),
+                    (SELECT o.order_date FROM orders o WHERE o.id = NEW.order_id))
+            ON DUPLICATE KEY UPDATE
+              units_ordered = units_ordered + VALUES(units_ordered),
+              order_lines = order_lines + 1,
+              open_orders = open_orders + VALUES(open_orders),
+              last_order_date = GREATEST(COALESCE(last_order_date, VALUES(last_order_date)),
+                                           COALESCE(VALUES(last_order_date), last_order_date));
+          END IF;
+        END
+        '''),
+        ('order_items_stats_delete', '''
+        CREATE TRIGGER order_items_stats_delete AFTER DELETE ON order_items FOR EACH ROW BEGIN
+          UPDATE product_order_stats SET
+            units_ordered = units_ordered - COALESCE(OLD.amount, 0),
+            order_lines = order_lines - 1,
+            open_orders = open_orders - (SELECT COUNT(*) FROM orders o WHERE o.id = OLD.order_id AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0) * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = OLD.order_id AND i.product_id = OLD.product_id AND i.id <> OLD.id)),
+            last_order_date = (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                                 WHERE i.product_id = OLD.product_id)
+          WHERE product_id = OLD.product_id;
+        END
+        '''),
+        ('orders_stats_update', '''
+        CREATE TRIGGER orders_stats_update AFTER UPDATE ON orders FOR EACH ROW BEGIN
+          IF NOT (NEW.status_id <=> OLD.status_id) OR NOT (NEW.order_date <=> OLD.order_date) THEN
+            UPDATE product_order_stats st SET
+              st.open_orders = st.open_orders + (1 - COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = NEW.status_id), 0)) - (1 - COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = OLD.status_id), 0)),
+              st.last_order_date = CASE WHEN NEW.order_date <=> OLD.order_date THEN st.last_order_date ELSE
+                (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                 WHERE i.product_id = st.product_id) END
+            WHERE st.product_id IN (SELECT i.product_id FROM order_items i WHERE i.order_id = NEW.id);
+          END IF;
+        END
+        '''),
+    ),
+    'sqlite': (
+        ('order_items_stats_insert', '''
+        CREATE TRIGGER order_items_stats_insert AFTER INSERT ON order_items
+        WHEN NEW.product_id IS NOT NULL
+        BEGIN
+            INSERT INTO product_order_stats (product_id, units_ordered, order_lines, open_orders, last_order_date)
+            VALUES (NEW.product_id, COALESCE(NEW.amount, 0), 1,
+                (SELECT COUNT(*) FROM orders o WHERE o.id = NEW.order_id
+                     AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0)
+                * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = NEW.order_id
+                               AND i.product_id = NEW.product_id AND i.id <> NEW.id)),
+                (SELECT o.order_date FROM orders o WHERE o.id = NEW.order_id))
+            ON CONFLICT DO UPDATE SET
+                units_ordered = units_ordered + excluded.units_ordered,
+                order_lines = order_lines + 1,
+                open_orders = open_orders + excluded.open_orders,
+                last_order_date = max(COALESCE(last_order_date, excluded.last_order_date),
+                                      COALESCE(excluded.last_order_date, last_order_date)),
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now');
+        END
+        '''),
+        ('order_items_stats_update', '''
+        CREATE TRIGGER order_items_stats_update AFTER UPDATE ON order_items
+        BEGIN
+            UPDATE product_order_stats SET
+                units_ordered = units_ordered - COALESCE(OLD.amount, 0),
+                order_lines = order_lines - 1,
+                open_orders = open_orders - (SELECT COUNT(*) FROM orders o WHERE o.id = OLD.order_id
+                     AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0)
+                * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = OLD.order_id
+                               AND i.product_id = OLD.product_id AND i.id <> OLD.id)),
+                last_order_date = (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                                   WHERE i.product_id = OLD.product_id),
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE product_id = OLD.product_id;
+            INSERT INTO product_order_stats (product_id, units_ordered, order_lines, open_orders, last_order_date)
+            SELECT NEW.product_id, COALESCE(NEW.amount, 0), 1,
+                (SELECT COUNT(*) FROM orders o WHERE o.id = NEW.order_id
+                     AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0)
+                * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = NEW.order_id
+                               AND i.product_id = NEW.product_id AND i.id <> NEW.id)),
+                (SELECT o.order_date FROM orders o WHERE o.id = NEW.order_id)
+            WHERE NEW.product_id IS NOT NULL
+            ON CONFLICT DO UPDATE SET
+                units_ordered = units_ordered + excluded.units_ordered,
+                order_lines = order_lines + 1,
+                open_orders = open_orders + excluded.open_orders,
+                last_order_date = max(COALESCE(last_order_date, excluded.last_order_date),
+                                      COALESCE(excluded.last_order_date, last_order_date)),
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now');
+        END
+        '''),
+        ('order_items_stats_delete', '''
+        CREATE TRIGGER order_items_stats_delete AFTER DELETE ON order_items
+        BEGIN
+            UPDATE product_order_stats SET
+                units_ordered = units_ordered - COALESCE(OLD.amount, 0),
+                order_lines = order_lines - 1,
+                open_orders = open_orders - (SELECT COUNT(*) FROM orders o WHERE o.id = OLD.order_id
+                     AND COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = o.status_id), 0) = 0)
+                * (1 - EXISTS (SELECT 1 FROM order_items i WHERE i.order_id = OLD.order_id
+                               AND i.product_id = OLD.product_id AND i.id <> OLD.id)),
+                last_order_date = (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                                   WHERE i.product_id = OLD.product_id),
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE product_id = OLD.product_id;
+        END
+        '''),
+        ('orders_stats_update', '''
+        CREATE TRIGGER orders_stats_update AFTER UPDATE ON orders
+        WHEN NEW.status_id IS NOT OLD.status_id OR NEW.order_date IS NOT OLD.order_date
+        BEGIN
+            UPDATE product_order_stats SET
+                open_orders = open_orders + (1 - COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = NEW.status_id), 0))
+                    - (1 - COALESCE((SELECT s.is_closed FROM order_statuses s WHERE s.id = OLD.status_id), 0)),
+                last_order_date = CASE WHEN NEW.order_date IS OLD.order_date THEN last_order_date ELSE
+                    (SELECT MAX(o.order_date) FROM order_items i JOIN orders o ON o.id = i.order_id
+                     WHERE i.product_id = product_order_stats.product_id) END,
+                updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE product_id IN (SELECT i.product_id FROM order_items i WHERE i.order_id = NEW.id);
+        END
+        '''),
+    ),
+}
+
+
+def up(schema):
+    schema.execute(STATS_TABLE[schema.dialect])
+    schema.create_index('product_order_stats', 'updated_at', ('updated_at',))
+    for name, body in TRIGGERS[schema.dialect]:
+        schema.create_trigger(name, body)
+    schema.execute('DELETE FROM product_order_stats')
+    schema.execute(BACKFILL)
+
+
+def down(schema):
+    for name, _ in reversed(TRIGGERS[schema.dialect]):
+        schema.drop_trigger(name)
+    schema.execute('DROP TABLE IF EXISTS product_order_stats')
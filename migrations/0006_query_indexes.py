@@ -0,0 +1,17 @@
+INDEXES = (
+    ('users', 'login', ('login',), True),
+    ('products', 'article', ('article',), True),
+    ('products', 'vendor_quantity', ('vendor_id', 'quantity', 'id'), False),
+    ('products', 'quantity', ('quantity', 'id'), False),
+    ('vendors', 'vendor_name', ('vendor_name',), True),
+)
+
+
+def up(schema):
+    for table, name, columns, unique in INDEXES:
+        schema.create_index(table, name, columns, unique=unique)
+
+
+def down(schema):
+    for table, name, _, _ in reversed(INDEXES):
+        schema.drop_index(table, name)
@@ -0,0 +1,22 @@
+import re
+
+GENERATED = "CONCAT('ART', LPAD(id, GREATEST(CHAR_LENGTH(id), 4), '0'))"
+GENERATED_ARTICLE = re.compile(r'ART(\d+)', re.IGNORECASE)
+
+
+def _generated(product_id):
+    return f'ART{product_id:04d}'
+
+
+def up(schema):
+    schema.execute("SELECT id, article FROM products WHERE article LIKE 'ART%'")
+    taken = [row['article'] for row in schema.cursor.fetchall()
+             if GENERATED_ARTICLE.fullmatch(row['article'])
+             and row['article'].upper() != _generated(row['id'])]
+    if taken:
+        raise schema.Error('Артикулы совпадают с автоматическими, измените их: ' + ', '.join(taken))
+    schema.execute(f'UPDATE products SET article = {GENERATED} WHERE article IS NULL')
+
+
+def down(schema):
+    schema.execute(f'UPDATE products SET article = NULL WHERE article = {GENERATED}')
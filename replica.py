@@ -0,0 +1,332 @@
+import os
+import sys
+import threading
+from datetime import datetime
+
+import db
+import localdb
+from catalog import SEARCH_FIELDS, normalize
+from metrics import timed
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(APP_DIR, 'levelup_replica.db')
+
+PRODUCT_COLUMNS = ('id', 'article', 'product_name', 'size', 'price', 'discount', 'quantity',
+                   'description', 'image', 'vendor_id', 'manufacturer_id', 'category_id',
+                   'units_ordered', 'open_orders', 'last_order_date')
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS replica_meta (
+    name VARCHAR(40) PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    category_name VARCHAR(30)
+);
+CREATE TABLE IF NOT EXISTS manufacturers (
+    id INTEGER PRIMARY KEY,
+    manufacturer_name VARCHAR(50)
+);
+CREATE TABLE IF NOT EXISTS vendors (
+    id INTEGER PRIMARY KEY,
+    vendor_name VARCHAR(50)
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    article VARCHAR(30),
+    product_name VARCHAR(40),
+    size VARCHAR(10),
+    price NUMERIC,
+    discount INT,
+    quantity INT,
+    description TEXT,
+    image VARCHAR(45),
+    vendor_id INT,
+    manufacturer_id INT,
+    category_id INT,
+    units_ordered INT NOT NULL DEFAULT 0,
+    open_orders INT NOT NULL DEFAULT 0,
+    last_order_date DATE
+);
+CREATE INDEX IF NOT EXISTS products_vendor_id ON products (vendor_id);
+CREATE INDEX IF NOT EXISTS products_quantity ON products (quantity, id);
+CREATE INDEX IF NOT EXISTS products_units_ordered ON products (units_ordered, id);
+CREATE INDEX IF NOT EXISTS products_open_orders ON products (open_orders, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5({', '.join(SEARCH_FIELDS)}, tokenize='trigram');
+'''
+
+PRODUCTS_QUERY = '''
+    SELECT p.id, p.article, p.product_name, p.size, p.price,
+           p.discount, p.quantity, p.description, p.image,
+           v.vendor_name, m.manufacturer_name, c.category_name,
+           p.vendor_id, p.manufacturer_id, p.category_id,
+           p.units_ordered, p.open_orders, p.last_order_date
+    FROM products p
+    LEFT JOIN vendors v ON p.vendor_id = v.id
+    LEFT JOIN manufacturers m ON p.manufacturer_id = m.id
+    LEFT JOIN categories c ON p.category_id = c.id
+'''
+
+REPLACE_PRODUCT = (f"REPLACE INTO products ({', '.join(PRODUCT_COLUMNS)}) "
+                   f"VALUES ({', '.join(['%s'] * len(PRODUCT_COLUMNS))})")
+INSERT_SEARCH_ROW = (f"INSERT INTO products_fts (rowid, {', '.join(SEARCH_FIELDS)}) "
+                     f"VALUES ({', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))})")
+SEARCH_FORMAT = 'normalized'
+
+
+def create_schema(path):
+    localdb.create_schema(path, SCHEMA)
+
+
+def _in(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+class Replica:
+    def __init__(self, path=DEFAULT_PATH, primary=db):
+        self.path = path
+        self.primary = primary
+        create_schema(path)
+        self._pool = db.ConnectionPool(connect=lambda: localdb.connect(path))
+        self._lock = threading.Lock()
+        self._synced = False
+        self._upgrade_search()
+
+    def _upgrade_search(self):
+        with self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            if self._meta(cursor, 'search') == SEARCH_FORMAT:
+                return
+            conn.begin()
+            try:
+                self._rebuild_search(cursor)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _meta(cursor, name):
+        cursor.execute('SELECT value FROM replica_meta WHERE name = %s', (name,))
+        row = cursor.fetchone()
+        return None if row is None else row['value']
+
+    @staticmethod
+    def _set_meta(cursor, name, value):
+        cursor.execute('REPLACE INTO replica_meta (name, value) VALUES (%s, %s)', (name, value))
+
+    def synced_at(self):
+        with self._pool.acquire() as conn:
+            value = self._meta(conn.cursor(), 'synced_at')
+        return None if value is None else datetime.fromisoformat(value)
+
+    def is_synced(self) -> bool:
+        self._synced = self._synced or self.synced_at() is not None
+        return self._synced
+
+    def _store_references(self, cursor, references, version):
+        for table, column in db.REFERENCE_TABLES.items():
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.executemany(f'INSERT INTO {table} (id, {column}) VALUES (%s, %s)',
+                               [(row['id'], row[column]) for row in references[table]])
+        self._rebuild_search(cursor)
+        self._set_meta(cursor, 'references', '|'.join(version))
+
+    @staticmethod
+    def _search_rows(rows):
+        return [(row['id'], *(normalize(row[f]) for f in SEARCH_FIELDS)) for row in rows]
+
+    def _rebuild_search(self, cursor):
+        cursor.execute('DELETE FROM products_fts')
+        cursor.execute(PRODUCTS_QUERY)
+        cursor.executemany(INSERT_SEARCH_ROW, self._search_rows(cursor.fetchall()))
+        self._set_meta(cursor, 'search', SEARCH_FORMAT)
+
+    def _store_products(self, cursor, rows):
+        if not rows:
+            return
+        cursor.executemany(REPLACE_PRODUCT, [tuple(row[c] for c in PRODUCT_COLUMNS) for row in rows])
+        cursor.execute(f'DELETE FROM products_fts WHERE rowid IN ({_in(rows)})',
+                       [row['id'] for row in rows])
+        cursor.executemany(INSERT_SEARCH_ROW, self._search_rows(rows))
+
+    @staticmethod
+    def _delete_products(cursor, product_ids):
+        if product_ids:
+            cursor.execute(f'DELETE FROM products WHERE id IN ({_in(product_ids)})', product_ids)
+            cursor.execute(f'DELETE FROM products_fts WHERE rowid IN ({_in(product_ids)})', product_ids)
+
+    def _copy(self, chunk_size, cancelled):
+        with self._lock, self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            references, version = self.primary.fetch_references()
+            stream = self.primary.stream_products(chunk_size, cancelled)
+            conn.begin()
+            try:
+                cursor.execute('DELETE FROM products')
+                self._store_references(cursor, references, version)
+                synced_at = None
+                for rows, loaded, total, synced_at in stream:
+                    self._store_products(cursor, rows)
+                    yield rows, loaded, total, synced_at
+                if cancelled() or synced_at is None:
+                    conn.rollback()
+                    return
+                self._set_meta(cursor, 'synced_at', synced_at)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                stream.close()
+        self._synced = True
+
+    def stream_products(self, chunk_size=db.CATALOG_CHUNK_SIZE, cancelled=lambda: False):
+        synced_at = self.synced_at()
+        if synced_at is None:
+            yield from self._copy(chunk_size, cancelled)
+            return
+
+        with self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) AS cnt FROM products')
+            total = cursor.fetchone()['cnt']
+            cursor.execute(PRODUCTS_QUERY + ' ORDER BY p.id')
+            loaded = 0
+            try:
+                while not cancelled():
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        if not loaded:
+                            yield [], 0, 0, synced_at
+                        break
+                    loaded += len(rows)
+                    yield rows, loaded, max(total, loaded), synced_at
+            finally:
+                cursor.close()
+
+    @timed('replica_sync')
+    def fetch_product_changes(self, since):
+        with self._lock:
+            with self._pool.acquire() as conn:
+                cursor = conn.cursor()
+                synced_at = self._meta(cursor, 'synced_at')
+                version = self._meta(cursor, 'references')
+            if synced_at is None:
+                return self.primary.fetch_product_changes(since)
+            since = min(since, datetime.fromisoformat(synced_at))
+
+            changes = self.primary.fetch_product_changes(since)
+            if changes is None:
+                with self._pool.acquire() as conn:
+                    conn.cursor().execute("DELETE FROM replica_meta WHERE name = 'synced_at'")
+                self._synced = False
+                return None
+            changed, deleted, now = changes
+            references = None
+            if '|'.join(self.primary.fetch_reference_version()) != version:
+                references = self.primary.fetch_references()
+
+            with self._pool.acquire() as conn:
+                cursor = conn.cursor()
+                conn.begin()
+                try:
+                    self._store_products(cursor, changed)
+                    self._delete_products(cursor, deleted)
+                    if references is not None:
+                        self._store_references(cursor, *references)
+                    self._set_meta(cursor, 'synced_at', now)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        return changed, deleted, now
+
+    def fetch_product(self, product_id):
+        if not self.is_synced():
+            return self.primary.fetch_product(product_id)
+        with self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(PRODUCTS_QUERY + ' WHERE p.id = %s', (product_id,))
+            return cursor.fetchone()
+
+    @timed('fetch_product_page')
+    def fetch_product_page(self, search='', vendor=None, sort=db.SORT_NONE, after=None,
+                           limit=db.CATALOG_PAGE_SIZE):
+        if not self.is_synced():
+            return self.primary.fetch_product_page(search, vendor, sort, after, limit)
+        field, _, descending = db.SORT_FIELDS[sort]
+        order_by, keyset = db.page_order(field, f'p.{field}', descending)
+        where = []
+        params = {'limit': limit}
+
+        if vendor:
+            where.append('v.vendor_name = %(vendor)s')
+            params['vendor'] = vendor
+
+        search = normalize(search.strip())
+        if len(search) >= 3:
+            where.append('p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH %(match)s)')
+            params['match'] = db.fulltext_query(search)
+        elif search:
+            where.append('p.id IN (SELECT rowid FROM products_fts WHERE '
+                         + ' OR '.join(f'{f} LIKE %(like)s' for f in SEARCH_FIELDS) + ')')
+            params['like'] = '%' + search + '%'
+
+        if after is not None:
+            where.append(keyset)
+            params['after_id'] = after['id']
+            if field is not None:
+                params['after_value'] = after[field]
+
+        query = PRODUCTS_QUERY
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += f' ORDER BY {order_by} LIMIT %(limit)s'
+
+        with self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def fetch_vendor_names(self):
+        if not self.is_synced():
+            return self.primary.fetch_vendor_names()
+        with self._pool.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(db.VENDOR_NAMES_QUERY)
+            return [row['vendor_name'] for row in cursor.fetchall()]
+
+    def close(self):
+        self._pool.close_all()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Локальная копия каталога')
+    parser.add_argument('--path', default=os.environ.get('LEVELUP_REPLICA') or DEFAULT_PATH)
+    parser.add_argument('--rebuild', action='store_true', help='загрузить каталог заново')
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    replica = Replica(args.path)
+    changes = replica.fetch_product_changes(replica.synced_at()) if replica.is_synced() else None
+    if changes is not None:
+        changed, deleted, _ = changes
+        print(f'Обновлено товаров: {len(changed)}, удалено: {len(deleted)}')
+    else:
+        loaded = 0
+        for _, loaded, _, _ in replica.stream_products():
+            pass
+        print(f'Загружено товаров: {loaded}')
+    replica.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
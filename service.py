@@ -0,0 +1,497 @@
+import asyncio
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from datetime import date, datetime
+from decimal import Decimal
+
+import db
+import images
+from catalog import CatalogStore, SearchIndex
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+SYNC_INTERVAL = 2.0
+CHANGE_LOG_SIZE = 1000
+QUERY_CACHE_SIZE = 16
+MAX_PAGE_SIZE = 1000
+HEARTBEAT_INTERVAL = 15
+IMAGE_CACHE_BUDGET = 32 * 1024 * 1024
+IMAGE_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+               '.bmp': 'image/bmp', '.gif': 'image/gif'}
+REQUEST_TIMEOUT = 10
+
+PRODUCT_FIELDS = ('id', 'article', 'product_name', 'size', 'price', 'discount', 'quantity',
+                  'description', 'image', 'vendor_name', 'manufacturer_name', 'category_name',
+                  'units_ordered', 'open_orders', 'last_order_date')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class ServiceError(Exception):
+    pass
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, default=_json_default).encode()
+
+
+def sort_key(store, sort):
+    field, _, descending = db.SORT_FIELDS[sort]
+    ids = store.ids
+    if field is None:
+        return lambda pos: (ids[pos],)
+    values = getattr(store, field)
+    if descending:
+        return lambda pos: (-values[pos], ids[pos])
+    return lambda pos: (values[pos], ids[pos])
+
+
+def fetch_all_products():
+    products, synced_at = [], None
+    for rows, loaded, total, synced_at in db.stream_products():
+        products.extend(rows)
+    return products, synced_at
+
+
+class CatalogState:
+    def __init__(self, log_size=CHANGE_LOG_SIZE):
+        self.instance = secrets.token_hex(4)
+        self.store = CatalogStore()
+        self.index = SearchIndex(self.store)
+        self.revision = 0
+        self.synced_at = None
+        self._log = deque(maxlen=log_size)
+        self._queries = OrderedDict()
+        self._subscribers = set()
+
+    def token(self) -> str:
+        return f'{self.instance}:{self.revision}'
+
+    def _revision(self, token):
+        instance, _, revision = str(token or '').partition(':')
+        if instance != self.instance or not revision.isdigit():
+            return None
+        return int(revision)
+
+    def load(self):
+        for rows, loaded, total, synced_at in db.stream_products():
+            for pos in self.store.extend(rows):
+                self.index.add(pos)
+            self.synced_at = synced_at
+
+    def missing(self, rows) -> list:
+        ids = {row['id'] for row in rows}
+        return [self.store.ids[pos] for pos in self.store.live_positions() if self.store.ids[pos] not in ids]
+
+    def product(self, pos) -> dict:
+        row = self.store.row(pos)
+        return {field: row[field] for field in PRODUCT_FIELDS}
+
+    def apply(self, changed=(), deleted=()):
+        store = self.store
+        changed_ids = []
+        for product in changed:
+            pos = store.position(product['id'])
+            before = None
+            if pos is not None:
+                before = self.product(pos)
+                self.index.remove(pos)
+            pos = store.upsert(product)
+            self.index.add(pos)
+            if self.product(pos) != before:
+                changed_ids.append(product['id'])
+        deleted_ids = []
+        for product_id in deleted:
+            pos = store.remove(product_id)
+            if pos is not None:
+                self.index.remove(pos)
+                deleted_ids.append(product_id)
+        if not changed_ids and not deleted_ids:
+            return
+        self.revision += 1
+        self._queries.clear()
+        self._log.append((self.revision, changed_ids, deleted_ids))
+        self.publish('changes', {'revision': self.token(), 'changed': changed_ids,
+                                 'deleted': deleted_ids})
+
+    def changes(self, token) -> dict:
+        since = self._revision(token)
+        oldest = self._log[0][0] - 1 if self._log else self.revision
+        if since is None or since > self.revision or since < oldest:
+            return {'reset': True, 'revision': self.token()}
+        changed, deleted = set(), set()
+        for revision, changed_ids, deleted_ids in self._log:
+            if revision > since:
+                changed.update(changed_ids)
+                deleted.update(deleted_ids)
+        positions = [self.store.position(product_id) for product_id in sorted(changed - deleted)]
+        return {'reset': False, 'revision': self.token(),
+                'changed': [self.product(pos) for pos in positions if pos is not None],
+                'deleted': sorted(deleted)}
+
+    def query(self, search='', vendor=None, sort=db.SORT_NONE):
+        key = (search, vendor, sort)
+        positions = self._queries.get(key)
+        if positions is not None:
+            self._queries.move_to_end(key)
+            return positions
+        positions = self.store.filter(vendor, self.index.search(search))
+        positions.sort(key=sort_key(self.store, sort))
+        self._queries[key] = positions
+        while len(self._queries) > QUERY_CACHE_SIZE:
+            self._queries.popitem(last=False)
+        return positions
+
+    def page(self, search='', vendor=None, sort=db.SORT_NONE, offset=0,
+             limit=db.CATALOG_PAGE_SIZE, after=None) -> dict:
+        positions = self.query(search, vendor, sort)
+        if after is not None:
+            offset = bisect_right(positions, after, key=sort_key(self.store, sort))
+        return {'revision': self.token(), 'total': len(positions), 'offset': offset,
+                'products': [self.product(pos) for pos in positions[offset:offset + limit]]}
+
+    def vendor_names(self):
+        store = self.store
+        counts = store.facets['vendor'].counts
+        return sorted(name for code, name in enumerate(store.vendors.values) if counts[code])
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event, data):
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+
+class ImageCache:
+    def __init__(self, budget=IMAGE_CACHE_BUDGET, image_dir=images.IMAGE_DIR):
+        self.budget = budget
+        self.image_dir = image_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def path(self, name, width, height):
+        if images.is_image_key(name):
+            return images.best_rendition(name, width, height, self.image_dir)[0]
+        if name != os.path.basename(name) or os.path.splitext(name)[1].lower() not in IMAGE_TYPES:
+            return None
+        return os.path.join(APP_DIR, name)
+
+    def get(self, name, width, height):
+        path = self.path(name, width, height)
+        if path is None:
+            return None
+        try:
+            key = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            return None
+        content_type = IMAGE_TYPES[os.path.splitext(path)[1].lower()]
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data, content_type
+        with open(path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.budget and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+        return data, content_type
+
+
+def _int(params, name, default=None, low=None, high=None):
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise HttpError(400, f'{name}: ожидается целое число')
+    if low is not None and value < low or high is not None and value > high:
+        raise HttpError(400, f'{name}: вне диапазона')
+    return value
+
+
+class CatalogService:
+    def __init__(self, state: CatalogState, image_cache: ImageCache):
+        self.state = state
+        self.images = image_cache
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            try:
+                method, target, _ = request.decode('latin-1').split(' ', 2)
+            except ValueError:
+                return
+            url = urllib.parse.urlsplit(target)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            if method != 'GET':
+                await self._send(writer, 405, dumps({'error': 'Поддерживается только GET'}))
+            elif url.path == '/events':
+                await self._events(writer)
+            else:
+                try:
+                    status, body, content_type = 200, *await self._route(url.path, params)
+                except HttpError as e:
+                    status, body, content_type = e.status, dumps({'error': str(e)}), None
+                except Exception as e:
+                    status, body, content_type = 500, dumps({'error': str(e)}), None
+                await self._send(writer, status, body, content_type)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, path, params):
+        state = self.state
+        if path == '/health':
+            return dumps({'products': len(state.store), 'revision': state.token(),
+                          'synced_at': state.synced_at}), None
+        if path == '/catalog':
+            sort = _int(params, 'sort', db.SORT_NONE, 0, len(db.SORT_FIELDS) - 1)
+            after = None
+            if params.get('after_id'):
+                _, _, descending = db.SORT_FIELDS[sort]
+                after_value = _int(params, 'after_value', 0)
+                after = (-after_value if descending else after_value, _int(params, 'after_id'))
+                if sort == db.SORT_NONE:
+                    after = after[1:]
+            return dumps(state.page(
+                search=params.get('search', ''), vendor=params.get('vendor') or None, sort=sort,
+                offset=_int(params, 'offset', 0, 0), after=after,
+                limit=_int(params, 'limit', db.CATALOG_PAGE_SIZE, 1, MAX_PAGE_SIZE))), None
+        if path.startswith('/products/'):
+            pos = state.store.position(_int({'id': path[len('/products/'):]}, 'id'))
+            if pos is None:
+                raise HttpError(404, 'Товар не найден')
+            return dumps(state.product(pos)), None
+        if path == '/changes':
+            return dumps(state.changes(params.get('since'))), None
+        if path == '/vendors':
+            return dumps(state.vendor_names()), None
+        if path == '/references':
+            references, version = await asyncio.to_thread(db.reference_cache().get_versioned)
+            return dumps({'references': references, 'version': version}), None
+        if path.startswith('/images/'):
+            name = urllib.parse.unquote(path[len('/images/'):])
+            image = await asyncio.to_thread(self.images.get, name, _int(params, 'w', 0, 0),
+                                            _int(params, 'h', 0, 0))
+            if image is None:
+                raise HttpError(404, 'Изображение не найдено')
+            return image
+        raise HttpError(404, 'Неизвестный адрес')
+
+    async def _send(self, writer, status, body, content_type=None):
+        head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                f'Content-Type: {content_type or "application/json; charset=utf-8"}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n')
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _events(self, writer):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n')
+        queue = self.state.subscribe()
+        try:
+            writer.write(b'event: hello\ndata: ' + dumps({'revision': self.state.token()}) + b'\n\n')
+            await writer.drain()
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                else:
+                    writer.write(f'event: {event}\ndata: '.encode() + dumps(data) + b'\n\n')
+                await writer.drain()
+        finally:
+            self.state.unsubscribe(queue)
+
+    async def sync_forever(self, interval=SYNC_INTERVAL):
+        state = self.state
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                references_changed = await asyncio.to_thread(db.reference_cache().check)
+                changes = await asyncio.to_thread(db.fetch_product_changes, state.synced_at)
+                if changes is None:
+                    rows, synced_at = await asyncio.to_thread(fetch_all_products)
+                    changes = rows, state.missing(rows), synced_at
+                changed, deleted, synced_at = changes
+            except Exception as e:
+                print(f'Ошибка синхронизации: {e}', file=sys.stderr)
+                continue
+            state.synced_at = synced_at
+            if references_changed:
+                state.publish('references', {'revision': state.token()})
+            state.apply(changed, deleted)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, sync_interval=SYNC_INTERVAL):
+    state = CatalogState()
+    start = time.perf_counter()
+    await asyncio.to_thread(state.load)
+    print(f'Каталог загружен: {len(state.store)} товаров за {time.perf_counter() - start:.1f} с',
+          file=sys.stderr)
+    service = CatalogService(state, ImageCache())
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f'Сервис каталога: http://{host}:{server.sockets[0].getsockname()[1]}', flush=True)
+    sync_task = asyncio.create_task(service.sync_forever(sync_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        sync_task.cancel()
+
+
+class CatalogServiceClient:
+    def __init__(self, url, timeout=REQUEST_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _url(self, path, **params):
+        query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        return self.url + path + ('?' + query if query else '')
+
+    def _open(self, path, timeout=None, **params):
+        try:
+            return urllib.request.urlopen(self._url(path, **params), timeout=timeout or self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e)['error']
+            except (ValueError, KeyError):
+                message = str(e)
+            raise ServiceError(message) from e
+        except urllib.error.URLError as e:
+            raise ServiceError(f'Сервис каталога недоступен: {e.reason}') from e
+
+    def _get(self, path, **params):
+        with self._open(path, **params) as response:
+            return json.load(response)
+
+    def stream_products(self, chunk_size=db.CATALOG_CHUNK_SIZE, cancelled=lambda: False):
+        after_id = None
+        revision = None
+        loaded = 0
+        while not cancelled():
+            page = self._get('/catalog', limit=chunk_size, after_id=after_id)
+            if revision is None:
+                revision = page['revision']
+            rows = page['products']
+            if rows:
+                loaded += len(rows)
+                after_id = rows[-1]['id']
+                yield rows, loaded, loaded + page['total'] - page['offset'] - len(rows), revision
+            elif not loaded:
+                yield [], 0, 0, revision
+            if len(rows) < chunk_size:
+                return
+
+    def fetch_product_changes(self, since):
+        data = self._get('/changes', since=since)
+        if data['reset']:
+            return None
+        return data['changed'], data['deleted'], data['revision']
+
+    def fetch_product_page(self, search='', vendor=None, sort=db.SORT_NONE, after=None,
+                           limit=db.CATALOG_PAGE_SIZE):
+        params = {'search': search or None, 'vendor': vendor, 'sort': sort, 'limit': limit}
+        if after is not None:
+            field = db.SORT_FIELDS[sort][0]
+            params.update(after_id=after['id'], after_value=after[field] if field else None)
+        return self._get('/catalog', **params)['products']
+
+    def fetch_vendor_names(self):
+        return self._get('/vendors')
+
+    def fetch_references(self):
+        data = self._get('/references')
+        return data['references'], tuple(data['version'])
+
+    def fetch_reference_version(self):
+        return self.fetch_references()[1]
+
+    def fetch_image(self, name, width, height):
+        try:
+            with self._open('/images/' + urllib.parse.quote(name), w=width, h=height) as response:
+                return response.read()
+        except ServiceError:
+            return None
+
+    def events(self):
+        with self._open('/events', timeout=HEARTBEAT_INTERVAL * 2) as response:
+            event, data = None, []
+            for line in response:
+                line = line.decode('utf-8').rstrip('\r\n')
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+                elif not line and event is not None:
+                    yield event, json.loads('\n'.join(data) or 'null')
+                    event, data = None, []
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сервис чтения каталога для торговых терминалов')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--sync-interval', type=float, default=SYNC_INTERVAL)
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='использовать локальную базу SQLite вместо MySQL')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        import localdb
+        db.configure_pool(connect=lambda: localdb.connect(args.sqlite))
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.sync_interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
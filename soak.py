@@ -0,0 +1,193 @@
+import argparse
+import ctypes
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import bench
+import localdb
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKDIR = os.path.join(APP_DIR, '.bench')
+
+DEFAULT_SIZE = 2000
+DEFAULT_CYCLES = 300
+WARMUP_CYCLES = 20
+REPORT_EVERY = 50
+HEAP_LIMIT_KB = 4096
+RSS_LIMIT_KB = 32768
+
+USERS = (('admin', '1234'), ('manager', '1234'))
+SEARCH_TERMS = ('', 'к', 'кро', 'зимние', 'Nord', '42')
+
+
+def current_rss_kb() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return bench.peak_rss_kb()
+
+
+def release_free_memory():
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def run_soak(db_path, cycles, warmup, keep_alive, seed):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('LEVELUP_REPLICA', '')
+    os.environ['LEVELUP_CATALOG_KEEP_ALIVE'] = str(keep_alive)
+    os.chdir(APP_DIR)
+
+    import db
+    import migrate
+    db.configure_pool(connect=lambda: localdb.connect(db_path))
+    migrate.migrate(dialect=migrate.SQLITE)
+
+    import main
+    from PyQt6.QtCore import QEvent, QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication, QMessageBox
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    messages = []
+    for name in ('critical', 'warning', 'information'):
+        setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: messages.append(args[1:3])))
+
+    def pump(ms=0):
+        loop = QEventLoop()
+        QTimer.singleShot(ms, loop.quit)
+        loop.exec()
+        app.sendPostedEvents(None, QEvent.Type.DeferredDelete)
+
+    def settle():
+        gc.collect()
+        pump()
+        release_free_memory()
+
+    def wait(condition, timeout=60):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError('Операция не завершилась')
+            pump(5)
+
+    rng = random.Random(seed)
+    login = main.Login()
+    login.show()
+    snapshot = main.catalog_snapshot()
+    unreleased = 0
+
+    def cycle(i):
+        nonlocal unreleased
+        user, password = USERS[i % len(USERS)]
+        login.le_login.setText(user)
+        login.le_password.setText(password)
+        login.login()
+        window = login.window
+        wait(lambda: not snapshot.is_loading())
+
+        window.le_search.setText(rng.choice(SEARCH_TERMS))
+        window.cb_vendor.setCurrentIndex(rng.randrange(window.cb_vendor.count()))
+        window.cb_sort.setCurrentIndex(rng.randrange(window.cb_sort.count()))
+        window.apply_filters()
+        pump()
+        window.show_all()
+        model = window.lw_products.model()
+        wait(lambda: model.rowCount() > 0)
+
+        if isinstance(window, main.Admin):
+            window._edit_product(model.index(rng.randrange(model.rowCount()), 0))
+            form = window.product_form()
+            form.sb_quantity.setValue(rng.randrange(60))
+            form._save()
+            wait(lambda: not form.isVisible())
+
+        window.exit()
+        pump()
+        if not keep_alive and snapshot.is_loaded():
+            unreleased += 1
+
+    for i in range(warmup):
+        cycle(i)
+    settle()
+
+    widgets = len(app.allWidgets())
+    rss = current_rss_kb()
+    tracemalloc.start()
+    for i in range(warmup, warmup + cycles):
+        cycle(i)
+        if (i - warmup + 1) % REPORT_EVERY == 0:
+            release_free_memory()
+            print(f'{i - warmup + 1}/{cycles}: куча +{tracemalloc.get_traced_memory()[0] // 1024} КБ, '
+                  f'RSS +{current_rss_kb() - rss} КБ, виджетов {len(app.allWidgets())}',
+                  file=sys.stderr)
+    settle()
+
+    heap = tracemalloc.get_traced_memory()[0] // 1024
+    top = tracemalloc.take_snapshot().statistics('lineno')[:5]
+    tracemalloc.stop()
+    return {
+        'cycles': cycles,
+        'heap_growth_kb': heap,
+        'rss_growth_kb': current_rss_kb() - rss,
+        'widgets_before': widgets,
+        'widgets_after': len(app.allWidgets()),
+        'unreleased_catalogs': unreleased,
+        'messages': messages,
+        'top': top,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка памяти при многократном входе и выходе')
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE)
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES)
+    parser.add_argument('--warmup', type=int, default=WARMUP_CYCLES)
+    parser.add_argument('--keep-alive', type=float, default=0,
+                        help='сколько секунд хранить каталог после выхода')
+    parser.add_argument('--heap-limit-kb', type=int, default=HEAP_LIMIT_KB)
+    parser.add_argument('--rss-limit-kb', type=int, default=RSS_LIMIT_KB)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f'soak_{args.size}_{args.seed}.db')
+    bench.generate_catalog(db_path, args.size, args.seed, os.path.join(args.workdir, 'images'))
+
+    result = run_soak(db_path, args.cycles, args.warmup, args.keep_alive, args.seed)
+    print(f"Циклов: {result['cycles']}, рост кучи {result['heap_growth_kb']} КБ "
+          f"(предел {args.heap_limit_kb}), RSS {result['rss_growth_kb']} КБ "
+          f"(предел {args.rss_limit_kb}), виджетов {result['widgets_before']} -> "
+          f"{result['widgets_after']}", file=sys.stderr)
+
+    failures = []
+    if result['heap_growth_kb'] > args.heap_limit_kb:
+        failures.append('рост кучи Python превышает предел')
+    if result['rss_growth_kb'] > args.rss_limit_kb:
+        failures.append('рост RSS превышает предел')
+    if result['widgets_after'] > result['widgets_before']:
+        failures.append('после выхода остаются неудалённые виджеты')
+    if result['unreleased_catalogs']:
+        failures.append(f"каталог не освобождён после выхода: {result['unreleased_catalogs']} раз")
+    for title, text in result['messages']:
+        failures.append(f'{title}: {text}')
+    if failures:
+        for stat in result['top']:
+            print(f'{stat.size // 1024} КБ в {stat.count} блоках', file=sys.stderr)
+            for line in stat.traceback.format()[-4:]:
+                print(f'    {line}', file=sys.stderr)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
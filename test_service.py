@@ -0,0 +1,158 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import db
+import localdb
+import migrate
+import service
+
+PRODUCTS = (
+    ('SN001', 'Кроссовки Ёжик', '42', 5000, 10, 3, 'Лёгкие летние'),
+    ('SN002', 'Кеды Classic', '38', 4200, 0, 0, 'Текстильные'),
+    ('SN003', 'Ботинки Winter', '41', 9100, 20, 7, 'Тёплые зимние'),
+)
+
+
+def create_catalog(path):
+    localdb.create_schema(path)
+    conn = localdb.connect(path)
+    try:
+        migrate.upgrade(conn, dialect=migrate.SQLITE)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO categories (category_name) VALUES ('Кроссовки')")
+        cursor.execute("INSERT INTO manufacturers (manufacturer_name) VALUES ('Nord')")
+        cursor.execute("INSERT INTO vendors (vendor_name) VALUES ('Обувь Плюс')")
+        cursor.executemany('''
+            INSERT INTO products (article, product_name, size, price, discount, quantity,
+                                  description, vendor_id, manufacturer_id, category_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 1, 1, 1)
+        ''', PRODUCTS)
+    finally:
+        conn.close()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+
+class CatalogServiceClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'catalog.db')
+        create_catalog(cls.path)
+        db.configure_pool(connect=lambda: localdb.connect(cls.path))
+        db.configure_references()
+        db.reference_cache().check_interval = 0
+
+        state = service.CatalogState()
+        state.load()
+        cls.service = service.CatalogService(state, service.ImageCache())
+        cls.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def run():
+            cls.server = await asyncio.start_server(cls.service.handle, '127.0.0.1', 0)
+            cls.sync_task = asyncio.create_task(cls.service.sync_forever(0.05))
+            started.set()
+
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+        asyncio.run_coroutine_threadsafe(run(), cls.loop).result()
+        started.wait()
+        port = cls.server.sockets[0].getsockname()[1]
+        cls.client = service.CatalogServiceClient(f'http://127.0.0.1:{port}')
+
+    @classmethod
+    def tearDownClass(cls):
+        async def stop():
+            cls.sync_task.cancel()
+            cls.server.close()
+            await cls.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+        db.get_pool().close_all()
+        cls.tmp.cleanup()
+
+    def execute(self, query, args=None):
+        conn = localdb.connect(self.path)
+        try:
+            conn.cursor().execute(query, args)
+        finally:
+            conn.close()
+
+    def test_stream_products(self):
+        rows = [row for chunk, _, _, _ in self.client.stream_products(chunk_size=2) for row in chunk]
+        self.assertEqual([row['article'] for row in rows], ['SN001', 'SN002', 'SN003'])
+
+    def test_product_page_search_and_sort(self):
+        rows = self.client.fetch_product_page('ежик')
+        self.assertEqual([row['article'] for row in rows], ['SN001'])
+        rows = self.client.fetch_product_page(sort=1, limit=2)
+        first = [row['id'] for row in rows]
+        rows += self.client.fetch_product_page(sort=1, after=rows[-1], limit=2)
+        self.assertEqual(len({row['id'] for row in rows}), 3)
+        self.assertEqual(first, [row['id'] for row in rows[:2]])
+
+    def test_product_changes(self):
+        _, _, _, revision = next(self.client.stream_products())
+        self.execute('UPDATE products SET quantity = 11 WHERE article = %s', ('SN002',))
+        changes = []
+
+        def changed():
+            changes[:] = [self.client.fetch_product_changes(revision)]
+            return any(row['quantity'] == 11 for row in changes[0][0])
+
+        wait_for(changed)
+        self.assertEqual(self.client.fetch_product_changes('unknown'), None)
+
+    def test_deletions_outside_retention(self):
+        _, _, now = db.fetch_product_changes(self.service.state.synced_at)
+        stale = now - db.DELETION_RETENTION - db.SYNC_OVERLAP
+        self.assertIsNone(db.fetch_product_changes(stale))
+        self.execute('INSERT INTO product_deletions (product_id, deleted_at) VALUES (%s, %s)',
+                     (1000, stale))
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            db.prune_deletions(cursor)
+            cursor.execute('SELECT COUNT(*) AS count FROM product_deletions WHERE product_id = 1000')
+            self.assertEqual(cursor.fetchone()['count'], 0)
+
+    def test_service_reloads_when_changes_are_stale(self):
+        state = self.service.state
+        revision = state.token()
+        asyncio.run_coroutine_threadsafe(self._expire(state), self.loop).result()
+        wait_for(lambda: state.synced_at > self.expired)
+        self.assertEqual(len(state.store), len(PRODUCTS))
+        self.assertIsNotNone(self.client.fetch_product_changes(revision))
+
+    async def _expire(self, state):
+        state.apply(deleted=[state.store.ids[0]])
+        state.synced_at = self.expired = state.synced_at - db.DELETION_RETENTION * 2
+
+    def test_reference_version_through_service(self):
+        references, version = self.client.fetch_references()
+        self.assertEqual(version, db.fetch_reference_version())
+        self.assertEqual([row['vendor_name'] for row in references['vendors']], ['Обувь Плюс'])
+
+        cache = db.ReferenceCache(check_interval=0, source=self.client)
+        cache.get_all()
+        self.assertFalse(cache.check())
+        self.execute("UPDATE vendors SET vendor_name = 'Обувь Минус' WHERE id = 1")
+        wait_for(cache.check)
+        self.assertEqual(cache.get('vendors')[0]['vendor_name'], 'Обувь Минус')
+
+
+if __name__ == '__main__':
+    unittest.main()